@@ -0,0 +1,112 @@
+"""
+Fingerprinted, precompressed frontend assets.
+
+At startup the scripts and icons are read once, named after a hash of
+their content (/assets/js/app.<hash>.js) and compressed with gzip, and
+brotli when installed. Those URLs never change content, so they are served
+with an immutable one-year Cache-Control. index.html, manifest.json and
+sw.js are rewritten to point at them; sw.js also gets the precache list and
+a cache name derived from the hashes, so a deploy replaces exactly the
+changed files in the clients' caches.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import re
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+# Files under frontend/ that get fingerprinted URLs
+FINGERPRINTED = ('js/api.js', 'js/replica.js', 'js/charts.js', 'js/app.js', 'icon-192.svg', 'icon-512.svg')
+
+PREFIX = '/assets/'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Pages that must be revalidated, with their public paths
+PAGES = {'/': 'index.html', '/manifest.json': 'manifest.json', '/sw.js': 'sw.js'}
+
+
+class Asset:
+    __slots__ = ('body', 'gzip', 'br', 'media_type', 'etag', 'cache_control')
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.body = body
+        self.gzip = gzip.compress(body, compresslevel=9, mtime=0)
+        self.br = brotli.compress(body, quality=11) if brotli is not None else None
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        self.cache_control = cache_control
+
+    def tag(self, encoding: str = None) -> str:
+        """Strong ETag of one representation: each encoding gets its own"""
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def encoded(self, accept_encoding: str):
+        """(body, content-encoding) for the best encoding the client accepts"""
+        accepted = {part.split(';')[0].strip() for part in accept_encoding.split(',')}
+        if self.br is not None and 'br' in accepted:
+            return self.br, 'br'
+        if 'gzip' in accepted:
+            return self.gzip, 'gzip'
+        return self.body, None
+
+
+def _media_type(name: str) -> str:
+    if name.endswith('.js'):
+        return 'application/javascript'
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def fingerprint(name: str, body: bytes) -> str:
+    stem, dot, ext = name.rpartition('.')
+    return f'{stem}.{hashlib.sha256(body).hexdigest()[:10]}.{ext}'
+
+
+def build(frontend: Path) -> dict:
+    """All served assets by URL path: fingerprinted files plus rewritten pages"""
+    assets = {}
+    urls = {}  # /static/<name> -> fingerprinted URL
+    for name in FINGERPRINTED:
+        body = (frontend / name).read_bytes()
+        url = PREFIX + fingerprint(name, body)
+        urls['/static/' + name] = url
+        assets[url] = Asset(body, _media_type(name), IMMUTABLE)
+
+    pattern = re.compile('|'.join(re.escape(u) for u in sorted(urls, key=len, reverse=True)))
+
+    def rewrite(name):
+        return pattern.sub(lambda m: urls[m.group(0)], (frontend / name).read_text(encoding='utf-8'))
+
+    for path, name in PAGES.items():
+        if name != 'sw.js':
+            assets[path] = Asset(rewrite(name).encode('utf-8'), _media_type(name), REVALIDATE)
+
+    # Any change to a page or asset gives the service worker a new cache name
+    version = hashlib.sha256(''.join(sorted(a.etag for a in assets.values())).encode()).hexdigest()[:12]
+    precache = ['/', *urls.values()]
+    text = rewrite('sw.js')
+    text = re.sub(r"const PRECACHE_VERSION = .*;", f"const PRECACHE_VERSION = '{version}';", text, count=1)
+    text = re.sub(r"const PRECACHE_ASSETS = \[[^\]]*\];",
+                  f"const PRECACHE_ASSETS = {json.dumps(precache)};", text, count=1)
+    assets['/sw.js'] = Asset(text.encode('utf-8'), _media_type('sw.js'), REVALIDATE)
+    return assets
+
+
+def respond(asset: Asset, request):
+    """Response for an asset, honouring If-None-Match and Accept-Encoding"""
+    from starlette.responses import Response
+
+    body, encoding = asset.encoded(request.headers.get('accept-encoding', ''))
+    etag = asset.tag(encoding)
+    headers = {'Cache-Control': asset.cache_control, 'ETag': etag, 'Vary': 'Accept-Encoding'}
+    if request.headers.get('if-none-match') == etag:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, media_type=asset.media_type, headers=headers)
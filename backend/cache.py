@@ -0,0 +1,81 @@
+"""
+In-process caches for the readings analytics endpoints and the settings.
+
+Entries are keyed on a data version that the write helpers in database.py
+bump on every change to readings or settings, so a stale result can never
+be served. Least recently used entries are evicted beyond `maxsize`.
+"""
+import threading
+from collections import OrderedDict
+
+from . import metrics
+
+
+class VersionedCache:
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Bump the data version and drop every cached result"""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def lookup(self, key):
+        """Return (found, value, version) and count the hit or miss"""
+        with self._lock:
+            entry_key = (key, self.version)
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return True, self._entries[entry_key], self.version
+            self.misses += 1
+            return False, None, self.version
+
+    def store(self, key, version, value):
+        with self._lock:
+            # Don't store results computed across a concurrent write
+            if self.version == version:
+                self._entries[(key, version)] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached result for key, computing it on a miss"""
+        found, value, version = self.lookup(key)
+        if not found:
+            value = compute()
+            self.store(key, version, value)
+        return value
+
+    async def get_or_run(self, key, compute, run):
+        """Like get_or_compute, but awaits run(compute) on a miss"""
+        found, value, version = self.lookup(key)
+        if not found:
+            with metrics.attributed_to('compute'):
+                value = await run(compute)
+            self.store(key, version, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0
+            }
+
+
+analytics_cache = VersionedCache()
+
+# Holds the one typed settings snapshot; invalidated on settings writes only
+settings_cache = VersionedCache(maxsize=1)
@@ -0,0 +1,67 @@
+"""
+Revision log of readings and settings for delta sync.
+
+`change_log` holds one row per reading date and setting key: the latest
+revision that touched it. Interval imports log one row per series, so
+the current revision changes with every write the analytics depend on.
+Triggers keep it current for every writer (including other workers and
+import_data.py). A write replaces the row, and AUTOINCREMENT hands out a
+revision above any issued before, so a client that has seen revision N
+asks for rows with rev > N. A reading whose date is gone from `readings`
+is a tombstone.
+
+Readings are logged on `readings` itself, so inserts, updates and
+deletes by any program show up, and again on `reading_yields`: a ledger
+write also changes the yield of the reading after a new one, or every
+reading when a price change rewrites the ledger.
+"""
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            rev INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            UNIQUE (entity, key)
+        )
+    ''')
+    triggers = {
+        'readings_inserted': "AFTER INSERT ON readings BEGIN {log} ('reading', NEW.date); END",
+        'readings_updated': "AFTER UPDATE ON readings BEGIN {log} ('reading', OLD.date); "
+                            "{log} ('reading', NEW.date); END",
+        'readings_deleted': "AFTER DELETE ON readings BEGIN {log} ('reading', OLD.date); END",
+        'reading_yields_inserted': "AFTER INSERT ON reading_yields BEGIN {log} ('reading', NEW.date); END",
+        'reading_yields_updated': "AFTER UPDATE ON reading_yields BEGIN {log} ('reading', NEW.date); END",
+        'settings_inserted': "AFTER INSERT ON settings BEGIN {log} ('setting', NEW.key); END",
+        'settings_updated': "AFTER UPDATE ON settings BEGIN {log} ('setting', NEW.key); END",
+    }
+    log = 'INSERT OR REPLACE INTO change_log (entity, key) VALUES'
+    for name, body in triggers.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body.format(log=log)}')
+
+
+def seed(cursor):
+    """Give every existing reading and setting a revision"""
+    cursor.execute('''
+        INSERT OR IGNORE INTO change_log (entity, key)
+        SELECT 'setting', key FROM settings ORDER BY key
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO change_log (entity, key)
+        SELECT 'reading', date FROM readings ORDER BY date
+    ''')
+
+
+def record(conn, entity: str, key: str):
+    """Log a change the triggers don't see"""
+    conn.execute('INSERT OR REPLACE INTO change_log (entity, key) VALUES (?, ?)', (entity, key))
+
+
+def current_revision(conn, entity: str = None) -> int:
+    """Latest revision overall, or of one entity (read through its key index)"""
+    if entity is None:
+        return conn.execute('SELECT COALESCE(MAX(rev), 0) FROM change_log').fetchone()[0]
+    return conn.execute(
+        'SELECT COALESCE(MAX(rev), 0) FROM change_log WHERE entity = ?', (entity,)
+    ).fetchone()[0]
@@ -0,0 +1,56 @@
+"""
+Conditional GET support for the read endpoints.
+
+ETags combine the change log revision of the data (see changelog.py) with
+the request URL, so a matching If-None-Match is answered with 304 before
+any query or computation runs. The revision lives in the database, so
+every worker hands out the same ETag for the same data.
+"""
+import hashlib
+from pathlib import Path
+
+from fastapi import Request, Response
+
+from .database import run_db, check_external_changes, data_revision, external_check_due
+
+CACHE_CONTROL = 'private, no-cache'
+
+# Same in every worker, but changes with a deploy, which may change the responses
+_CODE_VERSION = hashlib.sha1(
+    b''.join(path.read_bytes() for path in sorted(Path(__file__).parent.rglob('*.py')))
+).hexdigest()[:8]
+
+
+class NotModified(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+
+def current_etag(request: Request) -> str:
+    url = f'{request.url.path}?{request.url.query}'
+    digest = hashlib.sha1(url.encode()).hexdigest()[:12]
+    return f'"{_CODE_VERSION}-{data_revision()}-{digest}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    return etag in (tag.strip().removeprefix('W/') for tag in if_none_match.split(','))
+
+
+async def conditional_get(request: Request, response: Response):
+    """Dependency: tag the response, or stop with 304 if the client is current"""
+    # Another worker's write must change the ETag here too
+    if external_check_due():
+        await run_db(check_external_changes)
+    etag = current_etag(request)
+    if etag_matches(request.headers.get('if-none-match', ''), etag):
+        raise NotModified(etag)
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = CACHE_CONTROL
+
+
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={'ETag': exc.etag, 'Cache-Control': CACHE_CONTROL})
@@ -1,122 +1,464 @@
+import asyncio
+import functools
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from datetime import datetime
+from itertools import islice
+
+from . import changelog, intervals, ledger, metrics, migrations, query_trace, sessions, settings_store
+from .cache import analytics_cache, settings_cache
 
 DB_PATH = Path(__file__).parent / "solar_data.db"
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+# Applied once per connection. WAL lets readers continue while an import is
+# writing, and synchronous=NORMAL is durable enough in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -8000",       # ~8 MB page cache
+    "PRAGMA mmap_size = 67108864",     # 64 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+
+# Prepared statements kept per connection by the sqlite3 module, so the
+# helpers below reuse their compiled statements instead of re-parsing them.
+STATEMENT_CACHE_SIZE = 128
+
+# One persistent connection per thread and database file. close_db() bumps
+# the generation so threads reopen lazily instead of using a closed handle.
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0
+
+
+def _connect(path=None):
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+        factory=query_trace.Connection if query_trace.ENABLED else sqlite3.Connection,
+    )
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    if query_trace.ENABLED:
+        query_trace.install(conn)
+    return conn
+
+
+def _thread_connection(name: str, connect):
+    conn, generation = getattr(_local, name, (None, None))
+    if conn is None or generation != _generation:
+        conn = connect()
+        with _connections_lock:
+            _connections.append(conn)
+        setattr(_local, name, (conn, _generation))
+    return conn
+
+
+def get_db():
+    """Return the calling thread's persistent connection"""
+    return _thread_connection('conn', _connect)
+
+
+def _connect_auth():
+    conn = _connect(Path(DB_PATH).with_name(sessions.AUTH_DB_NAME))
+    sessions.create_tables(conn.cursor())
     return conn
 
+
+def get_auth_db():
+    """The calling thread's connection to the login sessions database"""
+    return _thread_connection('auth_conn', _connect_auth)
+
+
+def close_db():
+    """Close all pooled connections, e.g. on shutdown"""
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        while _connections:
+            _connections.pop().close()
+
+
+# Async access: blocking helpers run on a small dedicated thread pool (each
+# worker keeps its own connection). At most DB_WORKERS + DB_QUEUE_SIZE calls
+# are submitted at once; further callers wait without blocking the loop.
+DB_WORKERS = 4
+DB_QUEUE_SIZE = 64
+
+_db_executor = None
+_db_slots = None
+_db_slots_loop = None
+
+
+def _get_db_executor():
+    global _db_executor
+    with _connections_lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix='db')
+        return _db_executor
+
+
+def _get_db_slots():
+    global _db_slots, _db_slots_loop
+    loop = asyncio.get_running_loop()
+    if _db_slots_loop is not loop:
+        _db_slots = asyncio.Semaphore(DB_WORKERS + DB_QUEUE_SIZE)
+        _db_slots_loop = loop
+    return _db_slots
+
+
+async def run_db(func, *args, **kwargs):
+    """Await a blocking database helper on the DB thread pool"""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    if query_trace.ENABLED:
+        call = query_trace.capture(call, get_db)
+    metrics.gauges['db_calls_in_flight'] += 1
+    try:
+        with metrics.timed('db'):
+            async with _get_db_slots():
+                result = await loop.run_in_executor(_get_db_executor(), call)
+    finally:
+        metrics.gauges['db_calls_in_flight'] -= 1
+    return query_trace.collect(result) if query_trace.ENABLED else result
+
+
+def shutdown_db_executor():
+    global _db_executor
+    with _connections_lock:
+        executor, _db_executor = _db_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+# Other processes (workers, import_data.py) can write to the database too.
+# PRAGMA data_version on the watcher connection changes whenever another
+# connection commits. Then readings written by programs that don't
+# maintain the ledger are caught up, and if the change log revision moved
+# (readings, settings or interval data, not e.g. sessions) the in-process
+# caches are dropped. Checked at most every CHANGE_CHECK_SECONDS, on the
+# DB pool: see external_check_due().
+CHANGE_CHECK_SECONDS = 1.0
+
+_watch_lock = threading.Lock()
+_watch = {'conn': None, 'generation': None, 'version': None, 'revision': None,
+          'settings_revision': None, 'checked': 0.0}
+
+
+def external_check_due() -> bool:
+    """Whether check_external_changes() would look at the database now (no I/O)"""
+    return time.monotonic() - _watch['checked'] >= CHANGE_CHECK_SECONDS
+
+
+def data_revision():
+    """Change log revision of the data this worker's caches reflect"""
+    return _watch['revision']
+
+
+def check_external_changes() -> bool:
+    """Catch up the ledger and drop cached results if the data changed elsewhere"""
+    if not external_check_due():
+        return False
+    # Another thread is already checking
+    if not _watch_lock.acquire(blocking=False):
+        return False
+    try:
+        if not external_check_due():
+            return False
+        if _watch['conn'] is None or _watch['generation'] != _generation:
+            conn = _connect()
+            with _connections_lock:
+                _connections.append(conn)
+            _watch.update(conn=conn, generation=_generation, version=None)
+        conn = _watch['conn']
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        _watch['checked'] = time.monotonic()
+        if version == _watch['version']:
+            return False
+        _watch['version'] = version
+        if ledger.pending_dates(conn):
+            # Our own ledger write doesn't change this connection's data_version
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                ledger.catch_up(conn)
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        changed = _note_revision(conn)
+    finally:
+        _watch_lock.release()
+    return changed
+
+
+def _note_revision(conn) -> bool:
+    """Drop the caches the data changed under since the last noted revision"""
+    revision = changelog.current_revision(conn)
+    settings_revision = changelog.current_revision(conn, 'setting')
+    if settings_revision != _watch['settings_revision']:
+        settings_cache.invalidate()
+    changed = revision != _watch['revision']
+    if changed:
+        analytics_cache.invalidate()
+    _watch.update(revision=revision, settings_revision=settings_revision)
+    return changed
+
+
+def _data_changed(conn):
+    """After a write: drop cached results and note the new revision, so
+    the watcher doesn't drop them again for our own commit"""
+    _note_revision(conn)
+
+
+@contextmanager
+def read_snapshot():
+    """Run the enclosed helper calls against one consistent read snapshot"""
+    conn = get_db()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn
+    finally:
+        conn.execute('COMMIT')
+
+
 def init_db():
+    """Bring the schema up to date; called once at startup from the app lifespan"""
     conn = get_db()
-    cursor = conn.cursor()
-
-    # Settings table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS settings (
-            key TEXT PRIMARY KEY,
-            value TEXT NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Readings table (monthly meter readings)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS readings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT NOT NULL UNIQUE,
-            meter_reading REAL NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    # Insert default settings if not exist
-    default_settings = {
-        'plant_size_kwp': '4.84',
-        'price_per_kwh': '0.518',
-        'expected_yield_per_kwp': '950',
-        'start_date': '2006-04-20',
-        'initial_meter_reading': '2110.5',
-        'address': 'Deutschland',
-        'latitude': '48.1351',
-        'longitude': '11.5820',
-        'currency': 'EUR',
-        'meter_change_date': '2017-09-01',
-        'meter_change_offset': '60712.35',
-        'pin_hash': '03ac674216f3e15c761ee1a5e255f067953623c8b388b4459e13f978d7c846f4'  # SHA256 of "1234"
-    }
+    migrations.migrate(conn)
 
-    for key, value in default_settings.items():
-        cursor.execute('''
-            INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)
-        ''', (key, value))
+    # Derived yield tables, rebuilt if readings were changed behind our back
+    with conn:
+        if ledger.is_stale(conn):
+            ledger.rebuild(conn)
+        else:
+            ledger.catch_up(conn)
+    _note_revision(conn)
 
-    conn.commit()
-    conn.close()
+def get_settings() -> settings_store.Settings:
+    """The typed settings snapshot; only queries after a settings change"""
+    check_external_changes()
+    return settings_cache.get_or_compute('settings', lambda: settings_store.load(get_db()))
 
 def get_setting(key: str) -> str:
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT value FROM settings WHERE key = ?', (key,))
-    row = cursor.fetchone()
-    conn.close()
-    return row['value'] if row else None
+    return get_settings().get(key)
 
 def get_all_settings() -> dict:
+    return dict(get_settings().raw)
+
+def save_settings(values: dict):
+    """Write several settings in one transaction"""
+    if not values:
+        return
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT key, value FROM settings')
-    rows = cursor.fetchall()
-    conn.close()
-    return {row['key']: row['value'] for row in rows}
+    settings_store.update(conn, values)
+    _data_changed(conn)
 
 def update_setting(key: str, value: str):
-    conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO settings (key, value, updated_at)
-        VALUES (?, ?, CURRENT_TIMESTAMP)
-    ''', (key, value))
-    conn.commit()
-    conn.close()
+    save_settings({key: value})
 
 def get_all_readings() -> list:
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM readings ORDER BY date ASC')
-    rows = cursor.fetchall()
-    conn.close()
+    rows = conn.execute('SELECT * FROM readings ORDER BY date ASC').fetchall()
+    return [dict(row) for row in rows]
+
+# Columns of an enriched reading, in response order
+READING_FIELDS = {
+    'id': 'r.id',
+    'date': 'r.date',
+    'meter_reading': 'r.meter_reading',
+    'yield_kwh': 'y.yield_kwh',
+    'yield_per_kwp': 'y.yield_per_kwp',
+    'revenue': 'y.revenue',
+}
+
+def _enriched_query(start=None, end=None, after=None, limit=None, fields=None):
+    columns = ', '.join(f'{READING_FIELDS[f]} AS {f}' for f in (fields or READING_FIELDS))
+    conditions, params = [], []
+    if start:
+        conditions.append('r.date >= ?')
+        params.append(start)
+    if end:
+        conditions.append('r.date <= ?')
+        params.append(end)
+    if after:
+        conditions.append('r.date > ?')
+        params.append(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    sql = f'''
+        SELECT {columns}
+        FROM readings r JOIN reading_yields y ON y.date = r.date
+        {where}
+        ORDER BY r.date ASC
+    '''
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+def get_enriched_readings(start: str = None, end: str = None, after: str = None,
+                          limit: int = None, fields: list = None) -> list:
+    """
+    Readings with their ledger yields in date order. start/end bound the
+    date range (inclusive), `after` is a keyset cursor (exclusive) and
+    `fields` projects the columns (names from READING_FIELDS).
+    """
+    sql, params = _enriched_query(start, end, after, limit, fields)
+    conn = get_db()
+    return [dict(row) for row in conn.execute(sql, params).fetchall()]
+
+def open_enriched_cursor(start: str = None, end: str = None):
+    """
+    Cursor over the enriched readings (tuples in READING_FIELDS order) on a
+    connection of its own, inside a read transaction: rows are fetched as
+    they are consumed, from one snapshot, without holding up the pool
+    threads' connections. Close `cursor.connection` when done.
+    """
+    sql, params = _enriched_query(start, end)
+    conn = _connect()
+    conn.row_factory = None
+    conn.execute('BEGIN')
+    return conn.execute(sql, params)
+
+def get_changes(since: int = 0) -> dict:
+    """
+    Readings and settings changed after revision `since`, with the dates of
+    deleted readings and the current revision. A `since` ahead of the
+    database (e.g. restored from a backup) is answered with everything and
+    reset=True.
+    """
+    with read_snapshot() as conn:
+        rev = changelog.current_revision(conn)
+        reset = since > rev
+        if reset:
+            since = 0
+        columns = ', '.join(f'{column} AS {field}' for field, column in READING_FIELDS.items())
+        readings = conn.execute(f'''
+            SELECT {columns}
+            FROM change_log c
+            JOIN readings r ON r.date = c.key
+            JOIN reading_yields y ON y.date = r.date
+            WHERE c.rev > ? AND c.entity = 'reading'
+            ORDER BY r.date ASC
+        ''', (since,)).fetchall()
+        deleted = conn.execute('''
+            SELECT c.key FROM change_log c
+            WHERE c.rev > ? AND c.entity = 'reading'
+              AND NOT EXISTS (SELECT 1 FROM readings r WHERE r.date = c.key)
+        ''', (since,)).fetchall()
+        settings = conn.execute('''
+            SELECT s.key, s.value FROM change_log c JOIN settings s ON s.key = c.key
+            WHERE c.rev > ? AND c.entity = 'setting'
+        ''', (since,)).fetchall()
+    return {
+        'rev': rev,
+        'reset': reset,
+        'readings': [dict(row) for row in readings],
+        'deleted': [row[0] for row in deleted],
+        'settings': {row['key']: row['value'] for row in settings},
+    }
+
+def get_readings_summary() -> dict:
+    """Count, first date and last reading, or None if there are no readings"""
+    conn = get_db()
+    row = conn.execute('''
+        SELECT date AS last_date, meter_reading AS last_reading,
+               (SELECT MIN(date) FROM readings) AS first_date,
+               (SELECT COUNT(*) FROM readings) AS count
+        FROM readings ORDER BY date DESC LIMIT 1
+    ''').fetchone()
+    return dict(row) if row else None
+
+def get_yearly_yields() -> list:
+    conn = get_db()
+    rows = conn.execute('SELECT year, yield_kwh, months FROM yearly_yields ORDER BY year ASC').fetchall()
+    return [dict(row) for row in rows]
+
+def get_monthly_yields() -> list:
+    conn = get_db()
+    rows = conn.execute('SELECT month, year, yield_kwh FROM monthly_yields ORDER BY month ASC, year ASC').fetchall()
     return [dict(row) for row in rows]
 
 def add_reading(date: str, meter_reading: float) -> int:
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO readings (date, meter_reading) VALUES (?, ?)
-    ''', (date, meter_reading))
-    conn.commit()
-    reading_id = cursor.lastrowid
-    conn.close()
-    return reading_id
+    with conn:
+        cursor = conn.execute('''
+            INSERT OR REPLACE INTO readings (date, meter_reading) VALUES (?, ?)
+        ''', (date, meter_reading))
+        # The new reading and the one after it are the only yields affected
+        ledger.catch_up(conn)
+    _data_changed(conn)
+    return cursor.lastrowid
 
 def delete_reading(reading_id: int):
     conn = get_db()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM readings WHERE id = ?', (reading_id,))
-    conn.commit()
-    conn.close()
+    with conn:
+        conn.execute('DELETE FROM readings WHERE id = ?', (reading_id,))
+        # Drops its ledger row; only the following reading's yield changes
+        ledger.catch_up(conn)
+    _data_changed(conn)
 
 def import_readings_bulk(readings: list):
+    import_readings_stream(readings)
+
+IMPORT_CHUNK_SIZE = 1000
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+def import_readings_stream(readings, progress=None) -> int:
+    """
+    Insert readings from any iterable in executemany chunks. Everything runs
+    in one transaction, so a failing source leaves the table untouched.
+    `progress` is called with the running row count after each chunk.
+    """
     conn = get_db()
-    cursor = conn.cursor()
-    for r in readings:
-        cursor.execute('''
-            INSERT OR REPLACE INTO readings (date, meter_reading) VALUES (?, ?)
-        ''', (r['date'], r['meter_reading']))
-    conn.commit()
-    conn.close()
+    count = 0
+    with conn:
+        for chunk in _chunks(readings, IMPORT_CHUNK_SIZE):
+            rows = [(r['date'], r['meter_reading']) for r in chunk]
+            conn.executemany('''
+                INSERT OR REPLACE INTO readings (date, meter_reading) VALUES (?, ?)
+            ''', rows)
+            count += len(rows)
+            if progress:
+                progress(count)
+        ledger.catch_up(conn)
+    _data_changed(conn)
+    return count
+
+def import_intervals(series: str, samples, progress=None) -> int:
+    conn = get_db()
+    count = intervals.ingest(conn, series, samples, progress)
+    _data_changed(conn)
+    return count
+
+def get_interval_series(series: str, start: int, end: int, resolution: int = 0) -> dict:
+    return intervals.query(get_db(), series, start, end, resolution)
 
-# Initialize DB on module load
-init_db()
+def get_interval_monthly(series: str) -> list:
+    return intervals.monthly_totals(get_db(), series)
+
+def get_cached_reference(key: str) -> dict:
+    conn = get_db()
+    row = conn.execute('SELECT payload, fetched_at FROM reference_cache WHERE key = ?', (key,)).fetchone()
+    return dict(row) if row else None
+
+def store_cached_reference(key: str, payload: str):
+    conn = get_db()
+    with conn:
+        conn.execute('''
+            INSERT OR REPLACE INTO reference_cache (key, payload, fetched_at) VALUES (?, ?, ?)
+        ''', (key, payload, time.time()))
@@ -0,0 +1,70 @@
+"""
+Downsampling of long time series for charts.
+
+Both methods return the indices of the points to keep, in order, so any
+number of parallel columns can be reduced the same way. LTTB keeps the
+visual shape of a line; min/max keeps every bucket's extremes (peaks).
+"""
+from datetime import date
+
+METHODS = ('lttb', 'minmax')
+
+
+def lttb(xs, ys, threshold: int) -> list:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` representative points"""
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    # First and last points are always kept; the rest is split in buckets
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / span
+        avg_y = sum(ys[avg_start:avg_end]) / span
+
+        ax, ay = xs[a], ys[a]
+        best, max_area = -1, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > max_area:
+                best, max_area = j, area
+        selected.append(best)
+        a = best
+
+    selected.append(n - 1)
+    return selected
+
+
+def minmax(xs, ys, threshold: int) -> list:
+    """Indices of the minimum and maximum of threshold // 2 equal buckets"""
+    n = len(xs)
+    if threshold >= n or threshold < 2:
+        return list(range(n))
+
+    buckets = threshold // 2
+    selected = []
+    for b in range(buckets):
+        start, end = b * n // buckets, (b + 1) * n // buckets
+        lo = min(range(start, end), key=ys.__getitem__)
+        hi = max(range(start, end), key=ys.__getitem__)
+        selected.extend(sorted({lo, hi}))
+    return selected
+
+
+def downsample(method: str, xs, ys, threshold: int) -> list:
+    return (minmax if method == 'minmax' else lttb)(xs, ys, threshold)
+
+
+def date_axis(dates) -> list:
+    """ISO dates as day numbers, for use as x values"""
+    return [date.fromisoformat(d[:10]).toordinal() for d in dates]
+
+
+def pick(indices, values) -> list:
+    return [values[i] for i in indices]
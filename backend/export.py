@@ -0,0 +1,186 @@
+"""
+Streaming export of the enriched readings as CSV, XLSX or Parquet.
+
+Rows are fetched from a database cursor BATCH_SIZE at a time and encoded
+as they arrive, so memory use does not grow with the export. Each
+next_chunk() call handles at most one batch, so a large export doesn't
+hold a database thread for its whole run. CSV is sent batch by batch and
+Parquet one row group per batch. An XLSX file is a zip that can only be
+sent once complete: openpyxl's write-only mode writes each batch of rows
+to a temporary file, and after the last batch the workbook is zipped into
+another temporary file and streamed from there.
+"""
+import csv
+import io
+import tempfile
+import threading
+from datetime import date
+
+BATCH_SIZE = 2000
+CHUNK_SIZE = 64 * 1024
+
+COLUMNS = ('id', 'date', 'meter_reading', 'yield_kwh', 'yield_per_kwp', 'revenue')
+
+
+def _row(values):
+    # Same rounding as the JSON readings: the ledger stores unrounded REALs
+    id_, day, reading, yield_kwh, per_kwp, revenue = values
+    return id_, day, reading, round(yield_kwh, 2) or 0, per_kwp, revenue
+
+
+class _Output:
+    """Write-only sink that keeps what was written since the last drain"""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet records absolute offsets in its footer
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+class Exporter:
+    media_type = 'application/octet-stream'
+    extension = ''
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.output = _Output()
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+    def drain(self) -> bytes:
+        return self.output.drain()
+
+    def next_chunk(self):
+        """
+        The next piece of the file after encoding at most one more batch:
+        b'' when that batch produced no output yet, None at the end (blocking)
+        """
+        with self._lock:
+            chunk = self.drain()
+            if not chunk and not self.finished:
+                rows = self.cursor.fetchmany(BATCH_SIZE)
+                if rows:
+                    self.write([_row(r) for r in rows])
+                else:
+                    self.finish()
+                    self.finished = True
+                chunk = self.drain()
+            if not chunk and self.finished:
+                return None
+            return chunk
+
+    def close(self):
+        with self._lock:
+            self.cursor.connection.close()
+
+
+class CSVExporter(Exporter):
+    media_type = 'text/csv'
+    extension = 'csv'
+
+    def __init__(self, cursor):
+        super().__init__(cursor)
+        self.write([COLUMNS])
+
+    def write(self, rows):
+        text = io.StringIO()
+        csv.writer(text, lineterminator='\n').writerows(rows)
+        self.output.write(text.getvalue().encode('utf-8'))
+
+
+class XLSXExporter(Exporter):
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    extension = 'xlsx'
+
+    def __init__(self, cursor):
+        super().__init__(cursor)
+        # Imported here: openpyxl is slow to load and only needed for exports
+        from openpyxl import Workbook
+
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet('Readings')
+        self.sheet.column_dimensions['B'].width = 12
+        self.sheet.append(COLUMNS)
+        self.file = None
+
+    def write(self, rows):
+        for id_, day, *values in rows:
+            # A date cell, so Excel sorts and filters it as a date
+            self.sheet.append((id_, date.fromisoformat(day), *values))
+
+    def finish(self):
+        self.file = tempfile.TemporaryFile()
+        self.workbook.save(self.file)
+        self.file.seek(0)
+
+    def drain(self) -> bytes:
+        return self.file.read(CHUNK_SIZE) if self.file is not None else b''
+
+    def close(self):
+        super().close()
+        if self.file is not None:
+            self.file.close()
+
+
+class ParquetExporter(Exporter):
+    media_type = 'application/vnd.apache.parquet'
+    extension = 'parquet'
+
+    def __init__(self, cursor):
+        super().__init__(cursor)
+        # Imported here: pyarrow is large and only needed for exports
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('id', pa.int64()),
+            ('date', pa.date32()),
+            ('meter_reading', pa.float64()),
+            ('yield_kwh', pa.float64()),
+            ('yield_per_kwp', pa.float64()),
+            ('revenue', pa.float64()),
+        ])
+        self.writer = pq.ParquetWriter(self.output, self.schema, compression='snappy')
+
+    def write(self, rows):
+        columns = [list(column) for column in zip(*rows)]
+        columns[1] = [date.fromisoformat(d) for d in columns[1]]
+        # One row group per batch
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(c, type=f.type) for c, f in zip(columns, self.schema)], schema=self.schema
+        ))
+
+    def finish(self):
+        self.writer.close()
+
+
+FORMATS = {'csv': CSVExporter, 'xlsx': XLSXExporter, 'parquet': ParquetExporter}
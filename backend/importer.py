@@ -0,0 +1,118 @@
+"""
+Streaming import of meter readings from Excel (.xlsx) and CSV files.
+
+The upload is spooled to disk, parsed row by row (openpyxl read-only mode
+for workbooks) and validated in a generator, so memory use does not grow
+with the file size. Rejected rows are reported with their reason.
+"""
+import csv
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+from itertools import chain
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+CSV_EXTENSIONS = ('.csv',)
+
+# Only the first rejected rows are reported in detail
+MAX_REPORTED_REJECTIONS = 100
+
+CSV_DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y', '%d.%m.%y', '%Y-%m-%d %H:%M:%S')
+
+
+def spool_upload(upload, suffix='') -> str:
+    """Copy an UploadFile to a temporary file on disk and return its path"""
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, 'wb') as out:
+        upload.file.seek(0)
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+    return path
+
+
+def iter_excel_rows(path):
+    # Imported here: openpyxl is slow to load and only needed for uploads
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in wb.active.iter_rows(values_only=True):
+            yield row
+    finally:
+        wb.close()
+
+
+def iter_csv_rows(path):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        first = f.readline()
+        delimiter = ';' if first.count(';') > first.count(',') else ','
+        for row in csv.reader(chain([first], f), delimiter=delimiter):
+            yield [_parse_csv_value(v, delimiter) for v in row]
+
+
+def _parse_csv_value(value, delimiter):
+    value = value.strip()
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    number = value
+    if delimiter == ';' and ',' in value:
+        # German number format: 1.234,5
+        number = value.replace('.', '').replace(',', '.')
+    try:
+        return float(number)
+    except ValueError:
+        return value or None
+
+
+def iter_rows(path, filename):
+    if filename.lower().endswith(CSV_EXTENSIONS):
+        return iter_csv_rows(path)
+    return iter_excel_rows(path)
+
+
+class Rejections:
+    """Counts rejected rows, keeping details of the first few only"""
+
+    def __init__(self, limit: int = MAX_REPORTED_REJECTIONS):
+        self.limit = limit
+        self.count = 0
+        self.rows = []
+
+    def add(self, row_number: int, reason: str):
+        self.count += 1
+        if len(self.rows) < self.limit:
+            self.rows.append({'row': row_number, 'reason': reason})
+
+    def as_dict(self) -> dict:
+        return {'rejected_count': self.count, 'rejected': self.rows}
+
+
+def validate_rows(rows, rejections: Rejections):
+    """
+    Yield {'date', 'meter_reading'} for each valid row. Blank rows are
+    skipped silently; other invalid rows are recorded in `rejections`.
+    """
+    for row_number, row in enumerate(rows, start=1):
+        if not row or len(row) < 2 or (row[0] is None and row[1] is None):
+            continue
+
+        date_val, meter_val = row[0], row[1]
+        if isinstance(date_val, datetime):
+            date_str = date_val.strftime('%Y-%m-%d')
+        elif isinstance(date_val, date):
+            date_str = date_val.isoformat()
+        else:
+            rejections.add(row_number, f'not a date: {date_val!r}')
+            continue
+
+        if isinstance(meter_val, bool) or not isinstance(meter_val, (int, float)):
+            rejections.add(row_number, f'not a meter reading: {meter_val!r}')
+            continue
+        if meter_val <= 0:
+            rejections.add(row_number, 'meter reading must be positive')
+            continue
+
+        yield {'date': date_str, 'meter_reading': float(meter_val)}
@@ -0,0 +1,206 @@
+"""
+High-resolution interval data (15-minute / hourly inverter and meter exports).
+
+Samples are stored per series in a WITHOUT ROWID table clustered on
+(series, ts), with ts as integer epoch seconds (UTC, interval start) and
+the energy produced in that interval. Hourly, daily and monthly rollups
+are maintained at ingest time, and queries read from the coarsest level
+that satisfies the requested range and resolution.
+"""
+import csv
+from datetime import datetime, timezone
+from itertools import chain
+
+from . import changelog
+
+HOUR = 3600
+DAY = 86400
+
+# Rollup levels, coarsest first, with their nominal bucket size in seconds
+LEVELS = (('month', 28 * DAY), ('day', DAY), ('hour', HOUR))
+
+INGEST_CHUNK_SIZE = 5000
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS interval_readings (
+            series TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            energy_kwh REAL NOT NULL,
+            PRIMARY KEY (series, ts)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS interval_rollups (
+            series TEXT NOT NULL,
+            level TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            energy_kwh REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            PRIMARY KEY (series, level, bucket)
+        ) WITHOUT ROWID
+    ''')
+
+
+def month_start(ts: int) -> int:
+    dt = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return int(datetime(dt.year, dt.month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def next_month(ts: int) -> int:
+    dt = datetime.fromtimestamp(month_start(ts), tz=timezone.utc)
+    year, month = (dt.year + 1, 1) if dt.month == 12 else (dt.year, dt.month + 1)
+    return int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp())
+
+
+def bucket_start(level: str, ts: int) -> int:
+    if level == 'month':
+        return month_start(ts)
+    size = DAY if level == 'day' else HOUR
+    return ts - ts % size
+
+
+def parse_timestamp(value) -> int:
+    """Epoch seconds from an epoch number, datetime or ISO string (naive = UTC)"""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = value.strip()
+        if value.lstrip('-').isdigit():
+            return int(value)
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def parse_csv(text_stream):
+    """Yield (ts, energy_kwh) from a timestamp;value export, skipping headers"""
+    first = text_stream.readline()
+    delimiter = ';' if first.count(';') > first.count(',') else ','
+    for row in csv.reader(chain([first], text_stream), delimiter=delimiter):
+        if len(row) < 2:
+            continue
+        try:
+            value = row[1].strip()
+            if delimiter == ';':
+                value = value.replace(',', '.')
+            yield parse_timestamp(row[0]), float(value)
+        except ValueError:
+            continue
+
+
+def ingest(conn, series: str, samples, progress=None) -> int:
+    """
+    Store (ts, energy_kwh) samples, replacing existing ones, and refresh the
+    rollups they touch. Runs in one transaction per chunk; returns the count.
+    `progress` is called with the running count after each chunk.
+    """
+    count = 0
+    chunk = []
+    for sample in samples:
+        chunk.append(sample)
+        if len(chunk) >= INGEST_CHUNK_SIZE:
+            count += _ingest_chunk(conn, series, chunk)
+            chunk = []
+            if progress:
+                progress(count)
+    if chunk:
+        count += _ingest_chunk(conn, series, chunk)
+        if progress:
+            progress(count)
+    return count
+
+
+def _ingest_chunk(conn, series, chunk):
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO interval_readings (series, ts, energy_kwh) VALUES (?, ?, ?)',
+            ((series, ts, energy) for ts, energy in chunk)
+        )
+        first = min(ts for ts, _ in chunk)
+        last = max(ts for ts, _ in chunk)
+        _refresh_rollups(conn, series, first, last)
+        changelog.record(conn, 'intervals', series)
+    return len(chunk)
+
+
+def _refresh_rollups(conn, series, first, last):
+    """Re-aggregate hour, day and month buckets covering first..last"""
+    start, end = bucket_start('hour', first), bucket_start('hour', last) + HOUR
+    conn.execute('''
+        INSERT OR REPLACE INTO interval_rollups (series, level, bucket, energy_kwh, samples)
+        SELECT series, 'hour', ts - ts % 3600, SUM(energy_kwh), COUNT(*)
+        FROM interval_readings
+        WHERE series = ? AND ts >= ? AND ts < ?
+        GROUP BY ts - ts % 3600
+    ''', (series, start, end))
+
+    start, end = bucket_start('day', first), bucket_start('day', last) + DAY
+    conn.execute('''
+        INSERT OR REPLACE INTO interval_rollups (series, level, bucket, energy_kwh, samples)
+        SELECT series, 'day', bucket - bucket % 86400, SUM(energy_kwh), SUM(samples)
+        FROM interval_rollups
+        WHERE series = ? AND level = 'hour' AND bucket >= ? AND bucket < ?
+        GROUP BY bucket - bucket % 86400
+    ''', (series, start, end))
+
+    start, end = month_start(first), next_month(last)
+    conn.execute('''
+        INSERT OR REPLACE INTO interval_rollups (series, level, bucket, energy_kwh, samples)
+        SELECT series, 'month',
+               CAST(strftime('%s', bucket, 'unixepoch', 'start of month') AS INTEGER),
+               SUM(energy_kwh), SUM(samples)
+        FROM interval_rollups
+        WHERE series = ? AND level = 'day' AND bucket >= ? AND bucket < ?
+        GROUP BY strftime('%Y-%m', bucket, 'unixepoch')
+    ''', (series, start, end))
+
+
+def choose_level(start: int, end: int, resolution: int) -> str:
+    """Coarsest rollup no coarser than `resolution` whose buckets align with the range"""
+    for level, size in LEVELS:
+        if size > resolution:
+            continue
+        if level == 'month':
+            aligned = month_start(start) == start and month_start(end) == end
+        else:
+            aligned = start % size == 0 and end % size == 0
+        if aligned:
+            return level
+    return 'raw'
+
+
+def query(conn, series: str, start: int, end: int, resolution: int = 0) -> dict:
+    """Energy per bucket for start <= ts < end at no coarser than `resolution` seconds"""
+    level = choose_level(start, end, resolution)
+    if level == 'raw':
+        rows = conn.execute('''
+            SELECT ts, energy_kwh FROM interval_readings
+            WHERE series = ? AND ts >= ? AND ts < ? ORDER BY ts ASC
+        ''', (series, start, end))
+    else:
+        rows = conn.execute('''
+            SELECT bucket, energy_kwh FROM interval_rollups
+            WHERE series = ? AND level = ? AND bucket >= ? AND bucket < ? ORDER BY bucket ASC
+        ''', (series, level, start, end))
+
+    timestamps, energy = [], []
+    for ts, value in rows:
+        timestamps.append(ts)
+        energy.append(value)
+    return {'series': series, 'level': level, 'ts': timestamps, 'energy_kwh': energy}
+
+
+def monthly_totals(conn, series: str) -> list:
+    """(year, month, energy_kwh) from the monthly rollup of a series"""
+    rows = conn.execute('''
+        SELECT bucket, energy_kwh FROM interval_rollups
+        WHERE series = ? AND level = 'month' ORDER BY bucket ASC
+    ''', (series,))
+    result = []
+    for bucket, value in rows:
+        dt = datetime.fromtimestamp(bucket, tz=timezone.utc)
+        result.append((dt.year, dt.month, value))
+    return result
@@ -0,0 +1,246 @@
+"""
+Background import jobs.
+
+Uploads are spooled to disk by the request handler and processed on a
+single worker thread (SQLite allows one writer at a time anyway), so the
+event loop stays free. Clients poll a job for progress or cancel it.
+
+Job state lives in a small SQLite file next to the main database, so a
+poll or cancel works whichever worker process it reaches. It is kept out
+of the main database because a readings import holds that write lock
+until it commits, and its progress has to be written in the meantime.
+The process running a job writes its progress and picks up a cancel
+request every SYNC_SECONDS.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+from . import database
+from .database import import_readings_stream, import_intervals
+from .importer import Rejections, iter_rows, validate_rows
+from .intervals import parse_csv
+
+JOBS_DB_NAME = 'import_jobs.db'
+
+# Finished jobs kept around for polling
+MAX_FINISHED_JOBS = 50
+
+# How often a running job saves its progress and checks for a cancel
+SYNC_SECONDS = 0.25
+
+_executor = None
+_active = {}
+_jobs_lock = threading.Lock()
+
+
+def _connect():
+    conn = sqlite3.connect(database.DB_PATH.with_name(JOBS_DB_NAME), timeout=5)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            series TEXT,
+            status TEXT NOT NULL,
+            parsed INTEGER NOT NULL DEFAULT 0,
+            inserted INTEGER NOT NULL DEFAULT 0,
+            rejections TEXT NOT NULL,
+            error TEXT,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            finished_at REAL
+        )
+    ''')
+    return closing(conn)
+
+
+class ImportCancelled(Exception):
+    pass
+
+
+class ImportJob:
+    def __init__(self, kind: str, filename: str, series: str = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.series = series
+        self.status = 'queued'
+        self.parsed = 0
+        self.inserted = 0
+        self.rejections = Rejections()
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._cancelled = threading.Event()
+        self._synced = 0.0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def track(self, rows):
+        """Count parsed rows and stop at the next row once cancelled"""
+        for row in rows:
+            self.sync()
+            if self._cancelled.is_set():
+                raise ImportCancelled()
+            self.parsed += 1
+            yield row
+
+    def create(self):
+        with _connect() as conn, conn:
+            conn.execute('''
+                INSERT INTO import_jobs (id, kind, filename, series, status, rejections, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (self.id, self.kind, self.filename, self.series, self.status,
+                  json.dumps(self.rejections.as_dict()), self.created_at))
+
+    def sync(self, force: bool = False):
+        """Save the progress and pick up a cancel from any worker, at most every SYNC_SECONDS"""
+        now = time.monotonic()
+        if not force and now - self._synced < SYNC_SECONDS:
+            return
+        self._synced = now
+        with _connect() as conn, conn:
+            conn.execute('''
+                UPDATE import_jobs
+                SET status = ?, parsed = ?, inserted = ?, rejections = ?, error = ?, finished_at = ?
+                WHERE id = ?
+            ''', (self.status, self.parsed, self.inserted, json.dumps(self.rejections.as_dict()),
+                  self.error, self.finished_at, self.id))
+            row = conn.execute('SELECT cancel_requested FROM import_jobs WHERE id = ?', (self.id,)).fetchone()
+        if row and row['cancel_requested']:
+            self.cancel()
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'filename': self.filename,
+            'series': self.series,
+            'status': self.status,
+            'parsed': self.parsed,
+            'inserted': self.inserted,
+            **self.rejections.as_dict(),
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+def _progress(job):
+    def update(count):
+        job.inserted = count
+        job.sync()
+    return update
+
+
+def _run(job: ImportJob, path: str):
+    try:
+        job.sync(force=True)
+        if job._cancelled.is_set():
+            job.status = 'cancelled'
+            return
+
+        job.status = 'running'
+        job.sync(force=True)
+        try:
+            if job.kind == 'intervals':
+                # Interval ingest commits per chunk; a cancel keeps finished chunks
+                with open(path, newline='', encoding='utf-8-sig') as f:
+                    job.inserted = import_intervals(job.series, job.track(parse_csv(f)), _progress(job))
+            else:
+                # Readings import is one transaction; a cancel rolls it back
+                rows = validate_rows(iter_rows(path, job.filename), job.rejections)
+                job.inserted = import_readings_stream(job.track(rows), _progress(job))
+            job.status = 'done'
+        except ImportCancelled:
+            job.status = 'cancelled'
+            if job.kind != 'intervals':
+                job.inserted = 0
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            if job.kind != 'intervals':
+                job.inserted = 0
+    finally:
+        job.finished_at = time.time()
+        os.unlink(path)
+        with _jobs_lock:
+            _active.pop(job.id, None)
+        job.sync(force=True)
+
+
+def _prune(conn):
+    conn.execute('''
+        DELETE FROM import_jobs WHERE finished_at IS NOT NULL AND id NOT IN (
+            SELECT id FROM import_jobs WHERE finished_at IS NOT NULL
+            ORDER BY finished_at DESC LIMIT ?
+        )
+    ''', (MAX_FINISHED_JOBS,))
+
+
+def _get_executor():
+    global _executor
+    with _jobs_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-job')
+        return _executor
+
+
+def submit(kind: str, path: str, filename: str, series: str = None) -> ImportJob:
+    """Queue an import of the spooled file at `path`; the job deletes it when done (blocking)"""
+    job = ImportJob(kind, filename, series)
+    with _connect() as conn, conn:
+        _prune(conn)
+    job.create()
+    with _jobs_lock:
+        _active[job.id] = job
+    _get_executor().submit(_run, job, path)
+    return job
+
+
+def _row_dict(row) -> dict:
+    job = dict(row)
+    rejections = json.loads(job.pop('rejections'))
+    del job['cancel_requested']
+    return {**job, **rejections}
+
+
+def get_job(job_id: str):
+    """The job's state as last saved, from any worker (blocking)"""
+    with _connect() as conn:
+        row = conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    return _row_dict(row) if row else None
+
+
+def cancel(job_id: str):
+    """Ask the process running the job to stop it; returns the job's state (blocking)"""
+    with _jobs_lock:
+        job = _active.get(job_id)
+    if job is not None:
+        job.cancel()
+    with _connect() as conn, conn:
+        conn.execute('''
+            UPDATE import_jobs SET cancel_requested = 1 WHERE id = ? AND finished_at IS NULL
+        ''', (job_id,))
+    return get_job(job_id)
+
+
+def shutdown():
+    """Cancel this process's outstanding jobs and wait for the worker to stop"""
+    global _executor
+    with _jobs_lock:
+        for job in _active.values():
+            job.cancel()
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
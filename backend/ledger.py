@@ -0,0 +1,180 @@
+"""
+Materialized yield ledger.
+
+Per-reading yields are stored in `reading_yields`, with yearly and monthly
+rollups in `yearly_yields` and `monthly_yields`. The write helpers in
+database.py keep them current by recomputing only the rows whose yield
+depends on the change; settings that affect every yield trigger a rebuild.
+
+Which readings changed comes from the change log: every reading logged
+after the ledger's own marker entry is pending. That includes readings
+written by other programs, which `catch_up()` picks up the same way.
+"""
+
+from . import changelog, yield_engine
+from .yield_engine import YieldParams
+
+# Settings every stored yield depends on; changing one rebuilds the ledger
+LEDGER_SETTINGS = {'meter_change_date', 'initial_meter_reading', 'plant_size_kwp', 'price_per_kwh'}
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reading_yields (
+            date TEXT PRIMARY KEY,
+            reading_id INTEGER NOT NULL,
+            yield_kwh REAL NOT NULL,
+            yield_per_kwp REAL NOT NULL,
+            revenue REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS yearly_yields (
+            year INTEGER PRIMARY KEY,
+            yield_kwh REAL NOT NULL,
+            months INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_yields (
+            month INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            yield_kwh REAL NOT NULL,
+            PRIMARY KEY (month, year)
+        )
+    ''')
+
+
+def _params(conn):
+    rows = conn.execute(
+        'SELECT key, value FROM settings WHERE key IN (?, ?, ?, ?)',
+        tuple(LEDGER_SETTINGS)
+    ).fetchall()
+    return YieldParams.from_settings({row['key']: row['value'] for row in rows})
+
+
+def _write_yields(conn, enriched):
+    conn.executemany('''
+        INSERT OR REPLACE INTO reading_yields (date, reading_id, yield_kwh, yield_per_kwp, revenue)
+        VALUES (?, ?, ?, ?, ?)
+    ''', ((r['date'], r['id'], r['yield_kwh'], r['yield_per_kwp'], r['revenue']) for r in enriched))
+
+
+def _write_rollups(conn, years, yearly, monthly):
+    """Replace the rollups of `years` with the aggregates computed for them"""
+    for year in years:
+        conn.execute('DELETE FROM monthly_yields WHERE year = ?', (year,))
+        if year not in yearly:
+            conn.execute('DELETE FROM yearly_yields WHERE year = ?', (year,))
+    conn.executemany(
+        'INSERT OR REPLACE INTO yearly_yields (year, yield_kwh, months) VALUES (?, ?, ?)',
+        ((year, total, count) for year, (total, count) in yearly.items())
+    )
+    conn.executemany(
+        'INSERT INTO monthly_yields (month, year, yield_kwh) VALUES (?, ?, ?)',
+        ((month, year, value) for (month, year), value in monthly.items())
+    )
+
+
+def refresh(conn, start_date, end_date=None, extra_years=()):
+    """Recompute yields of readings dated start_date..end_date and their rollups"""
+    params = _params(conn)
+
+    prev = conn.execute(
+        'SELECT date, meter_reading FROM readings WHERE date < ? ORDER BY date DESC LIMIT 1',
+        (start_date,)
+    ).fetchone()
+
+    if end_date is None:
+        rows = conn.execute(
+            'SELECT id, date, meter_reading FROM readings WHERE date >= ? ORDER BY date ASC',
+            (start_date,)
+        )
+    else:
+        rows = conn.execute(
+            'SELECT id, date, meter_reading FROM readings WHERE date >= ? AND date <= ? ORDER BY date ASC',
+            (start_date, end_date)
+        )
+
+    result = yield_engine.run(
+        rows, params,
+        prev_date=prev['date'] if prev else '',
+        prev_reading=prev['meter_reading'] if prev else None
+    )
+    _write_yields(conn, result['enriched'])
+
+    # Rollups need every reading of the touched years, not just the range
+    years = {int(r['date'][:4]) for r in result['enriched']} | {int(y) for y in extra_years}
+    dates, yields = [], []
+    for year in sorted(years):
+        for r in conn.execute(
+            'SELECT date, yield_kwh FROM reading_yields WHERE date >= ? AND date < ? ORDER BY date ASC',
+            (str(year), str(year + 1))
+        ):
+            dates.append(r['date'])
+            yields.append(r['yield_kwh'])
+    yearly, monthly = yield_engine.aggregate(dates, yields)
+    _write_rollups(conn, years, yearly, monthly)
+
+
+def mark_current(conn):
+    """Record that the ledger reflects every reading logged so far"""
+    changelog.record(conn, 'ledger', '')
+
+
+def pending_dates(conn) -> list:
+    """Dates of readings written or deleted since the ledger was last updated"""
+    rows = conn.execute('''
+        SELECT key FROM change_log
+        WHERE entity = 'reading' AND rev > (SELECT rev FROM change_log WHERE entity = 'ledger')
+    ''').fetchall()
+    return [row[0] for row in rows]
+
+
+def catch_up(conn) -> bool:
+    """Recompute the yields the pending readings affect; False if none were pending"""
+    dates = pending_dates(conn)
+    if not dates:
+        return False
+    first, last = min(dates), max(dates)
+    # Deleted readings leave their ledger rows behind
+    conn.execute(
+        'DELETE FROM reading_yields WHERE date >= ? AND date <= ? AND date NOT IN (SELECT date FROM readings)',
+        (first, last)
+    )
+    # The reading after the last change has a new predecessor
+    refresh(conn, first, next_date(conn, last) or last, extra_years={d[:4] for d in dates})
+    mark_current(conn)
+    return True
+
+
+def next_date(conn, date):
+    row = conn.execute(
+        'SELECT date FROM readings WHERE date > ? ORDER BY date ASC LIMIT 1', (date,)
+    ).fetchone()
+    return row['date'] if row else None
+
+
+def rebuild(conn):
+    """Recompute the whole ledger from scratch in a single engine pass"""
+    conn.execute('DELETE FROM reading_yields')
+    conn.execute('DELETE FROM yearly_yields')
+    conn.execute('DELETE FROM monthly_yields')
+    rows = conn.execute('SELECT id, date, meter_reading FROM readings ORDER BY date ASC')
+    result = yield_engine.run(rows, _params(conn))
+    _write_yields(conn, result['enriched'])
+    _write_rollups(conn, (), result['yearly'], result['monthly'])
+    mark_current(conn)
+
+
+def is_stale(conn):
+    """True if readings and ledger disagree, e.g. after an external import"""
+    row = conn.execute('''
+        SELECT
+            (SELECT COUNT(*) FROM readings) AS readings,
+            (SELECT COUNT(*) FROM reading_yields) AS ledger,
+            (SELECT COUNT(*) FROM readings r
+             LEFT JOIN reading_yields y ON y.date = r.date AND y.reading_id = r.id
+             WHERE y.date IS NULL) AS missing
+    ''').fetchone()
+    return row['readings'] != row['ledger'] or row['missing'] > 0
@@ -1,60 +1,88 @@
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from starlette.responses import JSONResponse, PlainTextResponse
 from pathlib import Path
 
+from . import assets, jobs, metrics, pvgis, query_trace
+from .cache import analytics_cache, settings_cache
+from .conditional import NotModified, not_modified_handler
+from .database import run_db, init_db, close_db, shutdown_db_executor
+from .serialization import APIGZipMiddleware, FastJSONResponse
 from .routes.readings import router as readings_router
 from .routes.settings import router as settings_router
 from .routes.reference import router as reference_router
-from .routes.auth import router as auth_router
+from .routes.auth import router as auth_router, verify_session
+from .routes.intervals import router as intervals_router
+from .routes.imports import router as imports_router
+from .routes.dashboard import router as dashboard_router, warm_up
+from .routes.sync import router as sync_router
+
+@asynccontextmanager
+async def lifespan(app):
+    # The server accepts connections only once startup is done
+    await run_db(init_db)
+    await run_db(warm_up)
+    if frontend_path.exists():
+        app.state.assets = await run_db(assets.build, frontend_path)
+    yield
+    # Graceful shutdown: stop imports, then close HTTP clients and the DB
+    jobs.shutdown()
+    await pvgis.close_client()
+    shutdown_db_executor()
+    close_db()
+
 
 app = FastAPI(
     title="Solar Tracker",
     description="Track your solar panel yield and compare with reference data",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
+# Conditional GETs answered with 304 before the endpoint runs
+app.add_exception_handler(NotModified, not_modified_handler)
+
 
-# Auth middleware - protects all /api/* routes except login and health
-class AuthMiddleware(BaseHTTPMiddleware):
+# Auth middleware - protects all /api/* routes except login and health.
+# Plain ASGI: allowed requests are passed through without wrapping the
+# request or response streams.
+class AuthMiddleware:
     OPEN_PATHS = {"/api/auth/login", "/api/health"}
 
-    async def dispatch(self, request, call_next):
-        path = request.url.path
+    def __init__(self, app):
+        self.app = app
 
-        # Skip CORS preflight requests
-        if request.method == "OPTIONS":
-            return await call_next(request)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
 
-        # Skip non-API routes (frontend, static files)
-        if not path.startswith("/api/"):
-            return await call_next(request)
+        path = scope["path"]
 
-        # Skip open endpoints
-        if path in self.OPEN_PATHS:
-            return await call_next(request)
+        # Skip CORS preflight requests, non-API routes (frontend, static
+        # files) and open endpoints
+        if scope["method"] == "OPTIONS" or not path.startswith("/api/") or path in self.OPEN_PATHS:
+            return await self.app(scope, receive, send)
 
         # Check authorization header
-        auth_header = request.headers.get("authorization", "")
-        if not auth_header.startswith("Bearer "):
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Nicht angemeldet"}
-            )
+        auth_header = b""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                auth_header = value
+                break
 
-        token = auth_header[7:]
-        from .routes.auth import verify_session
-        if not verify_session(token):
-            return JSONResponse(
-                status_code=401,
-                content={"detail": "Sitzung abgelaufen"}
-            )
+        if not auth_header.startswith(b"Bearer "):
+            detail = "Nicht angemeldet"
+        elif not await verify_session(auth_header[7:].decode("latin-1")):
+            detail = "Sitzung abgelaufen"
+        else:
+            return await self.app(scope, receive, send)
 
-        return await call_next(request)
+        response = JSONResponse(status_code=401, content={"detail": detail})
+        await response(scope, receive, send)
 
 
 # CORS
@@ -64,35 +92,70 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "Server-Timing"],
 )
 
 # Auth (added after CORS so CORS headers are set even on 401 responses)
 app.add_middleware(AuthMiddleware)
 
+# Per-request SQLite statement reports, only with SQL_TRACE=1
+if query_trace.ENABLED:
+    app.add_middleware(query_trace.QueryTraceMiddleware)
+
+# Compresses API JSON; inside metrics so compression counts towards latency
+app.add_middleware(APIGZipMiddleware)
+
+# Outermost, so request timing covers every other layer
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Include API routes
 app.include_router(auth_router)
 app.include_router(readings_router)
 app.include_router(settings_router)
 app.include_router(reference_router)
+app.include_router(intervals_router)
+app.include_router(imports_router)
+app.include_router(dashboard_router)
+app.include_router(sync_router)
 
 # Serve frontend static files
 frontend_path = Path(__file__).parent.parent / "frontend"
 
 if frontend_path.exists():
+    # Unfingerprinted files, still reachable under their plain names
     app.mount("/static", StaticFiles(directory=frontend_path), name="static")
 
+    def serve_asset(request: Request, path: str):
+        asset = request.app.state.assets.get(path)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+        return assets.respond(asset, request)
+
     @app.get("/")
-    async def serve_frontend():
-        return FileResponse(frontend_path / "index.html")
+    async def serve_frontend(request: Request):
+        return serve_asset(request, "/")
 
     @app.get("/manifest.json")
-    async def serve_manifest():
-        return FileResponse(frontend_path / "manifest.json")
+    async def serve_manifest(request: Request):
+        return serve_asset(request, "/manifest.json")
 
     @app.get("/sw.js")
-    async def serve_sw():
-        return FileResponse(frontend_path / "sw.js", media_type="application/javascript")
+    async def serve_sw(request: Request):
+        return serve_asset(request, "/sw.js")
+
+    @app.get("/assets/{name:path}")
+    async def serve_fingerprinted(request: Request, name: str):
+        return serve_asset(request, assets.PREFIX + name)
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy", "app": "Solar Tracker"}
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Prometheus metrics of this worker process (requires login like all /api routes)"""
+    body = metrics.render(
+        {"analytics": analytics_cache.stats(), "settings": settings_cache.stats()},
+        {"pvgis_requests_in_flight": len(pvgis._inflight)}
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,160 @@
+"""
+Request instrumentation.
+
+Every request gets a Server-Timing header splitting its time into db,
+compute (cached analytics computed on a miss), serialize and upstream
+(PVGIS) phases. Per-route latency histograms, in-flight gauges and cache
+hit ratios are exported in Prometheus text format by /api/metrics.
+
+Everything is recorded on the event loop thread with a few perf_counter
+calls and dict updates, cheap enough to stay on in production. Values
+are per worker process.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('db', 'compute', 'serialize', 'upstream')
+
+# Phase durations of the current request, and a phase that overrides the
+# one being recorded (DB calls made to compute a cache entry count as compute)
+_timings = ContextVar('timings', default=None)
+_phase = ContextVar('phase', default=None)
+
+_latency = {}    # (method, route) -> [bucket counts..., +Inf count, sum]
+_responses = {}  # (method, route, status) -> count
+_counters = {}   # (name, label) -> count
+gauges = {'http_requests_in_flight': 0, 'db_calls_in_flight': 0}
+
+
+def record(phase: str, seconds: float):
+    timings = _timings.get()
+    if timings is not None:
+        phase = _phase.get() or phase
+        timings[phase] = timings.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timed(phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(phase, time.perf_counter() - start)
+
+
+@contextmanager
+def attributed_to(phase: str):
+    """Record everything timed inside the block as `phase`"""
+    token = _phase.set(phase)
+    try:
+        yield
+    finally:
+        _phase.reset(token)
+
+
+def increment(name: str, label: str):
+    _counters[(name, label)] = _counters.get((name, label), 0) + 1
+
+
+def observe(method: str, route: str, status: int, seconds: float):
+    series = _latency.get((method, route))
+    if series is None:
+        series = _latency[(method, route)] = [0] * (len(LATENCY_BUCKETS) + 2)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            series[i] += 1
+            break
+    else:
+        series[len(LATENCY_BUCKETS)] += 1
+    series[-1] += seconds
+    key = (method, route, status)
+    _responses[key] = _responses.get(key, 0) + 1
+
+
+def server_timing(timings: dict, total: float) -> str:
+    parts = [f'{phase};dur={timings[phase] * 1000:.1f}' for phase in PHASES if phase in timings]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class MetricsMiddleware:
+    """Times each HTTP request and adds its Server-Timing header"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        timings = {}
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = server_timing(timings, time.perf_counter() - start)
+                message["headers"] = [*message.get("headers", ()), (b"server-timing", header.encode())]
+            await send(message)
+
+        gauges['http_requests_in_flight'] += 1
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            gauges['http_requests_in_flight'] -= 1
+            _timings.reset(token)
+            # The route template keeps label cardinality bounded
+            route = scope.get("route")
+            observe(scope["method"], route.path if route else "other", status, time.perf_counter() - start)
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+def render(caches: dict, extra_gauges: dict = None) -> str:
+    """All metrics in Prometheus text exposition format"""
+    lines = [
+        '# HELP solar_http_request_duration_seconds Request latency by route',
+        '# TYPE solar_http_request_duration_seconds histogram',
+    ]
+    for (method, route), series in sorted(_latency.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), series):
+            cumulative += count
+            lines.append(f'solar_http_request_duration_seconds_bucket'
+                         f'{_labels(method=method, route=route, le=bound)} {cumulative}')
+        lines.append(f'solar_http_request_duration_seconds_sum{_labels(method=method, route=route)} {series[-1]:.6f}')
+        lines.append(f'solar_http_request_duration_seconds_count{_labels(method=method, route=route)} {cumulative}')
+
+    lines += ['# HELP solar_http_responses_total Responses by route and status',
+              '# TYPE solar_http_responses_total counter']
+    for (method, route, status), count in sorted(_responses.items()):
+        lines.append(f'solar_http_responses_total{_labels(method=method, route=route, status=status)} {count}')
+
+    for name, value in {**gauges, **(extra_gauges or {})}.items():
+        lines += [f'# TYPE solar_{name} gauge', f'solar_{name} {value}']
+
+    lines += ['# HELP solar_cache_lookups_total Cache lookups by result',
+              '# TYPE solar_cache_lookups_total counter']
+    for cache, stats in caches.items():
+        lines.append(f'solar_cache_lookups_total{_labels(cache=cache, result="hit")} {stats["hits"]}')
+        lines.append(f'solar_cache_lookups_total{_labels(cache=cache, result="miss")} {stats["misses"]}')
+    lines += ['# TYPE solar_cache_hit_ratio gauge']
+    for cache, stats in caches.items():
+        lines.append(f'solar_cache_hit_ratio{_labels(cache=cache)} {stats["hit_ratio"]}')
+
+    for name in sorted({name for name, _ in _counters}):
+        lines.append(f'# TYPE solar_{name}_total counter')
+        for (counter, label), count in sorted(_counters.items()):
+            if counter == name:
+                lines.append(f'solar_{name}_total{_labels(result=label)} {count}')
+
+    return '\n'.join(lines) + '\n'
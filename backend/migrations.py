@@ -0,0 +1,131 @@
+"""
+Schema migrations keyed on PRAGMA user_version.
+
+MIGRATIONS[i] brings the database from version i to i + 1. `migrate()`
+runs once at startup from the app lifespan; on an up-to-date database it
+costs a single PRAGMA read. Version 1 is the schema that init_db() used
+to create on every import, written with IF NOT EXISTS so databases from
+before versioning upgrade in place.
+"""
+from . import changelog, intervals, ledger, sessions
+
+DEFAULT_SETTINGS = {
+    'plant_size_kwp': '4.84',
+    'price_per_kwh': '0.518',
+    'expected_yield_per_kwp': '950',
+    'start_date': '2006-04-20',
+    'initial_meter_reading': '2110.5',
+    'address': 'Deutschland',
+    'latitude': '48.1351',
+    'longitude': '11.5820',
+    'currency': 'EUR',
+    'meter_change_date': '2017-09-01',
+    'meter_change_offset': '60712.35',
+    'pin_hash': '03ac674216f3e15c761ee1a5e255f067953623c8b388b4459e13f978d7c846f4'  # SHA256 of "1234"
+}
+
+
+def _initial_schema(cursor):
+    # Settings table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Readings table (monthly meter readings)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS readings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL UNIQUE,
+            meter_reading REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    cursor.executemany('''
+        INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)
+    ''', DEFAULT_SETTINGS.items())
+
+    # Derived yield tables
+    ledger.create_tables(cursor)
+
+    # High-resolution interval data and its rollups
+    intervals.create_tables(cursor)
+
+    # Login sessions shared by all workers (moved to their own file in version 6)
+    sessions.create_tables(cursor)
+
+    # Cached PVGIS responses keyed on normalized request parameters
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reference_cache (
+            key TEXT PRIMARY KEY,
+            payload TEXT NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+
+
+def _index_monthly_yields_year(cursor):
+    # Ledger refreshes replace a year's rollup; the (month, year) key can't serve that
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_monthly_yields_year ON monthly_yields (year)')
+
+
+def _change_log(cursor):
+    # Revisions for delta sync, starting from the data already there
+    changelog.create_tables(cursor)
+    changelog.seed(cursor)
+
+
+def _log_reading_inserts(cursor):
+    # Version 3 logged new readings only through their ledger rows, which
+    # writers other than this app (import_data.py, the sqlite3 shell) don't write
+    changelog.create_tables(cursor)
+
+
+def _mark_ledger(cursor):
+    # Readings logged after this marker are waiting for a ledger update
+    ledger.mark_current(cursor)
+
+
+def _move_sessions(cursor):
+    # Logins must not wait for an import's write lock on this database
+    sessions.move_tables(cursor)
+
+
+MIGRATIONS = [
+    _initial_schema,
+    _index_monthly_yields_year,
+    _change_log,
+    _log_reading_inserts,
+    _mark_ledger,
+    _move_sessions,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn) -> int:
+    """Apply the missing migrations in one transaction; returns the new version"""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return SCHEMA_VERSION
+
+    # Take the write lock first, so workers starting together migrate once
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = schema_version(conn)
+        cursor = conn.cursor()
+        for step in MIGRATIONS[version:]:
+            step(cursor)
+        conn.execute(f'PRAGMA user_version = {max(version, SCHEMA_VERSION)}')
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return SCHEMA_VERSION
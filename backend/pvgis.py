@@ -0,0 +1,174 @@
+"""
+PVGIS (EU JRC) reference data client.
+
+Uses one long-lived HTTP client and caches responses in SQLite keyed on the
+normalized request parameters. Concurrent identical requests share a
+single upstream call, and expired entries are served while a background
+refresh runs. At most UPSTREAM_CONCURRENCY requests go to PVGIS at once,
+background refreshes included.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING
+
+from . import metrics
+from .database import run_db, get_cached_reference, store_cached_reference
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Overridable so tests can point at a local stand-in server
+PVGIS_URL = os.environ.get("PVGIS_URL", "https://re.jrc.ec.europa.eu/api/v5_2/PVcalc")
+PVGIS_TIMEOUT = 30
+
+# PVGIS results for a configuration are effectively static
+CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+# Parallel upstream requests per worker (PVGIS rate-limits clients)
+UPSTREAM_CONCURRENCY = 6
+
+_client = None
+_inflight = {}
+_upstream_slots = None
+_upstream_slots_loop = None
+
+
+class UpstreamError(Exception):
+    """PVGIS could not be reached or returned an error status"""
+
+
+def get_client() -> "httpx.AsyncClient":
+    global _client
+    if _client is None or _client.is_closed:
+        # Imported here: httpx is slow to load and only needed for PVGIS
+        import httpx
+        _client = httpx.AsyncClient(timeout=PVGIS_TIMEOUT)
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def normalize_params(lat, lon, peakpower, loss, angle, aspect) -> dict:
+    """Round parameters so equivalent requests share a cache entry"""
+    return {
+        'lat': round(float(lat), 4),
+        'lon': round(float(lon), 4),
+        'peakpower': round(float(peakpower), 3),
+        'loss': round(float(loss), 1),
+        'angle': round(float(angle), 1),
+        'aspect': round(float(aspect), 1),
+    }
+
+
+def cache_key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True)
+
+
+def _get_upstream_slots():
+    global _upstream_slots, _upstream_slots_loop
+    loop = asyncio.get_running_loop()
+    if _upstream_slots_loop is not loop:
+        _upstream_slots = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+        _upstream_slots_loop = loop
+    return _upstream_slots
+
+
+async def _fetch(params: dict) -> dict:
+    import httpx
+    try:
+        async with _get_upstream_slots():
+            with metrics.timed('upstream'):
+                response = await get_client().get(PVGIS_URL, params={
+                    **params,
+                    'outputformat': 'json',
+                    'pvtechchoice': 'crystSi',
+                    'mountingplace': 'building',
+                })
+                response.raise_for_status()
+        return response.json()
+    except httpx.HTTPError as e:
+        raise UpstreamError(str(e)) from e
+    except ValueError as e:
+        # An HTML error page or a truncated body, even with status 200
+        raise UpstreamError(f'Invalid JSON from PVGIS: {e}') from e
+
+
+async def _fetch_and_store(key: str, params: dict) -> dict:
+    data = await _fetch(params)
+    await run_db(store_cached_reference, key, json.dumps(data))
+    return data
+
+
+def _single_flight(key: str, params: dict) -> asyncio.Task:
+    """Return the in-flight upstream request for key, starting one if needed"""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_and_store(key, params))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _inflight.pop(key, None))
+    return task
+
+
+def _log_refresh_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("PVGIS background refresh failed: %s", task.exception())
+
+
+async def get_reference(params: dict):
+    """
+    PVGIS response for normalized params, plus how it was served:
+    'hit', 'stale' (refresh started in the background) or 'miss'.
+    """
+    key = cache_key(params)
+    entry = await run_db(get_cached_reference, key)
+    if entry:
+        data = json.loads(entry['payload'])
+        if time.time() - entry['fetched_at'] < CACHE_TTL_SECONDS:
+            metrics.increment('pvgis_cache_lookups', 'hit')
+            return data, 'hit'
+        metrics.increment('pvgis_cache_lookups', 'stale')
+        _single_flight(key, params).add_done_callback(_log_refresh_failure)
+        return data, 'stale'
+
+    metrics.increment('pvgis_cache_lookups', 'miss')
+    # Shield so one cancelled client doesn't abort the shared request
+    return await asyncio.shield(_single_flight(key, params)), 'miss'
+
+
+async def sweep(base: dict, angles, aspects, losses) -> list:
+    """
+    Fetch every angle x aspect x loss combination of `base` concurrently;
+    upstream requests, including refreshes of stale entries, are limited
+    to UPSTREAM_CONCURRENCY. Returns (params, data, error) per combination
+    in grid order; cached configurations cost no request.
+    """
+    async def fetch_one(params):
+        try:
+            data, _ = await get_reference(params)
+            return params, data, None
+        except UpstreamError as e:
+            return params, None, str(e)
+
+    grid = [
+        normalize_params(base['lat'], base['lon'], base['peakpower'], loss, angle, aspect)
+        for loss in losses for angle in angles for aspect in aspects
+    ]
+    return await asyncio.gather(*(fetch_one(p) for p in grid))
+
+
+def monthly_energy(data: dict) -> list:
+    """The 12 monthly E_m values of a PVGIS response"""
+    values = [0.0] * 12
+    for m in data.get('outputs', {}).get('monthly', {}).get('fixed', []):
+        values[m['month'] - 1] = m.get('E_m', 0)
+    return values
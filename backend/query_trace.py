@@ -0,0 +1,253 @@
+"""
+Opt-in SQLite query tracing (SQL_TRACE=1).
+
+Connections are opened with a cursor class that times execute and fetch
+calls, plus a trace callback and a progress handler. The statements a
+request runs through run_db are collected with the time spent inside
+SQLite and their VM step count. At the end of the request the query count, total
+time, slowest and repeated statements are added to the Server-Timing
+header and logged when the request is slow or over QUERY_BUDGET. Slow
+statements and statements that scan a whole table are logged with their
+EXPLAIN QUERY PLAN, explained once per statement shape. Reports show
+statement shapes only, never parameter values (PIN hashes, tokens).
+
+    SQL_TRACE=1 SLOW_QUERY_MS=20 SLOW_REQUEST_MS=200 QUERY_BUDGET=25
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+ENABLED = os.environ.get('SQL_TRACE', '') not in ('', '0')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 20))
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 200))
+# A reading write runs 15-17 statements (ledger refresh, change log,
+# revision checks); trigger sub-programs count as part of their statement
+QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 25))
+
+# VM instructions between progress handler calls
+PROGRESS_STEPS = 1000
+
+# Statements worth explaining and reporting; BEGIN/COMMIT etc. are not
+_QUERY = re.compile(r'\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', re.IGNORECASE)
+# The trace callback gets the SQL with parameters filled in
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_request = ContextVar('sql_trace', default=None)
+_plans = {}  # statement shape -> EXPLAIN QUERY PLAN details
+
+
+class Statement:
+    __slots__ = ('sql', 'duration', 'steps')
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.duration = 0.0
+        self.steps = 0
+
+
+def shape(sql: str) -> str:
+    """The statement with literals replaced by ?, so equal queries compare equal"""
+    return ' '.join(_LITERAL.sub('?', sql).split())
+
+
+class Cursor(sqlite3.Cursor):
+    """Adds the time spent in execute and fetch calls to the traced statements"""
+    _statement = None
+
+    def execute(self, *args):
+        return self._timed(super().execute, args, starts=True)
+
+    def executemany(self, *args):
+        return self._timed(super().executemany, args, starts=True)
+
+    def fetchone(self):
+        return self._timed(super().fetchone, ())
+
+    def fetchmany(self, *args):
+        return self._timed(super().fetchmany, args)
+
+    def fetchall(self):
+        return self._timed(super().fetchall, ())
+
+    def __next__(self):
+        return self._timed(super().__next__, ())
+
+    def _timed(self, call, args, starts=False):
+        statements = getattr(_local, 'statements', None)
+        if statements is None:
+            return call(*args)
+        first = len(statements)
+        if starts:
+            _local.reported = False
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            if starts:
+                _local.reported = None
+                # The call's query, after an implicit BEGIN if there was one
+                self._statement = statements[-1] if len(statements) > first else None
+            if self._statement is not None:
+                self._statement.duration += elapsed
+
+
+class Connection(sqlite3.Connection):
+    def cursor(self, factory=Cursor):
+        return super().cursor(factory)
+
+    # The C implementations don't go through cursor(); route them explicitly
+    def execute(self, *args):
+        return self.cursor().execute(*args)
+
+    def executemany(self, *args):
+        return self.cursor().executemany(*args)
+
+
+def install(conn):
+    """Attach the trace hooks to a new connection (opened with factory=Connection)"""
+    conn.set_trace_callback(_on_statement)
+    conn.set_progress_handler(_on_progress, PROGRESS_STEPS)
+
+
+def _on_statement(sql: str):
+    statements = getattr(_local, 'statements', None)
+    if statements is None:
+        return
+    # Within one execute call, only the first query is a statement of its
+    # own: sqlite3 reports each trigger sub-program (and each executemany
+    # parameter set) again with the SQL of the statement that ran it
+    reported = getattr(_local, 'reported', None)
+    if reported is not None and _QUERY.match(sql):
+        if reported:
+            return
+        _local.reported = True
+    statements.append(Statement(sql))
+
+
+def _on_progress():
+    statements = getattr(_local, 'statements', None)
+    if statements:
+        statements[-1].steps += PROGRESS_STEPS
+    return 0
+
+
+def capture(call, connect):
+    """Wrap a DB helper call so it returns (result, statements it ran)"""
+    def traced():
+        _local.statements = []
+        try:
+            result = call()
+        finally:
+            statements, _local.statements = _local.statements, None
+        _explain(connect(), statements)
+        return result, statements
+    return traced
+
+
+def collect(traced_result):
+    """Add captured statements to the current request; returns the helper's result"""
+    result, statements = traced_result
+    request = _request.get()
+    if request is not None:
+        request.extend(statements)
+    return result
+
+
+def _explain(conn, statements):
+    for statement in statements:
+        key = shape(statement.sql)
+        if key in _plans or not _QUERY.match(statement.sql):
+            continue
+        try:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + statement.sql).fetchall()
+            _plans[key] = [row[3] for row in rows]
+        except Exception as e:
+            _plans[key] = [f'(not explained: {e})']
+
+
+def full_scans(plan: list) -> list:
+    return [step for step in plan
+            if step.startswith('SCAN ') and ' USING ' not in step
+            and 'CONSTANT ROW' not in step and '(subquery' not in step]
+
+
+def _oneline(sql: str) -> str:
+    return shape(sql)[:200]
+
+
+def summarize(statements: list) -> dict:
+    queries = [s for s in statements if _QUERY.match(s.sql)]
+    repeated = Counter(s.sql for s in queries)
+    flagged = []
+    for s in queries:
+        plan = _plans.get(shape(s.sql), [])
+        if s.duration * 1000 >= SLOW_QUERY_MS or full_scans(plan):
+            flagged.append((s, plan))
+    return {
+        'count': len(queries),
+        'total_ms': sum(s.duration for s in statements) * 1000,
+        'slowest': sorted(queries, key=lambda s: s.duration, reverse=True)[:5],
+        'repeated': [(sql, n) for sql, n in repeated.most_common() if n > 1],
+        'flagged': flagged,
+    }
+
+
+def _format(method: str, path: str, elapsed_ms: float, summary: dict) -> str:
+    lines = [f"{method} {path}: {elapsed_ms:.1f} ms, {summary['count']} queries "
+             f"in {summary['total_ms']:.1f} ms (budget {QUERY_BUDGET})"]
+    for s in summary['slowest']:
+        lines.append(f"  top   {s.duration * 1000:7.2f} ms {s.steps:>8} steps  {_oneline(s.sql)}")
+    for sql, n in summary['repeated']:
+        lines.append(f"  {n}x    {_oneline(sql)}")
+    seen = set()
+    for s, plan in summary['flagged']:
+        key = shape(s.sql)
+        if key not in seen:
+            seen.add(key)
+            lines.append(f"  plan  {key[:200]}")
+            lines.extend(f"        {step}" for step in plan)
+    return '\n'.join(lines)
+
+
+class QueryTraceMiddleware:
+    """Collects the statements of each request and reports on them"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        statements = []
+        token = _request.set(statements)
+
+        async def send_with_trace(message):
+            if message["type"] == "http.response.start":
+                total = sum(s.duration for s in statements) * 1000
+                count = sum(1 for s in statements if _QUERY.match(s.sql))
+                header = f'sql;dur={total:.1f};desc="{count} queries"'
+                message["headers"] = [*message.get("headers", ()), (b"server-timing", header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace)
+        finally:
+            _request.reset(token)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            summary = summarize(statements)
+            over = (elapsed_ms >= SLOW_REQUEST_MS or summary['count'] > QUERY_BUDGET
+                    or summary['repeated'] or summary['flagged'])
+            if statements:
+                logger.log(logging.WARNING if over else logging.DEBUG,
+                           _format(scope["method"], scope["path"], elapsed_ms, summary))
@@ -1,36 +1,31 @@
 import hashlib
-import secrets
-from datetime import datetime, timedelta
+import os
 
 from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
 
-from ..database import get_setting, update_setting
+from ..database import run_db, get_auth_db, get_setting, update_setting
+from ..sessions import open_store
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
-# In-memory session store: token -> expiry
-sessions = {}
-
 SESSION_DURATION_HOURS = 24
 
+# memory, sqlite or signed; anything but memory works with several workers
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
 
-def hash_pin(pin: str) -> str:
-    return hashlib.sha256(pin.encode()).hexdigest()
+sessions = open_store(SESSION_BACKEND, SESSION_DURATION_HOURS * 3600, get_auth_db)
 
 
-def verify_session(token: str) -> bool:
-    if token in sessions and sessions[token] > datetime.now():
-        return True
-    sessions.pop(token, None)
-    return False
+def hash_pin(pin: str) -> str:
+    return hashlib.sha256(pin.encode()).hexdigest()
 
 
-def _cleanup_sessions():
-    now = datetime.now()
-    expired = [t for t, exp in sessions.items() if exp <= now]
-    for t in expired:
-        del sessions[t]
+async def verify_session(token: str) -> bool:
+    valid = sessions.cached(token)
+    if valid is None:
+        valid = await run_db(sessions.verify, token)
+    return valid
 
 
 class LoginRequest(BaseModel):
@@ -44,19 +39,17 @@ class ChangePinRequest(BaseModel):
 
 @router.post("/login")
 async def login(request: LoginRequest):
-    stored_hash = get_setting("pin_hash")
+    stored_hash = await run_db(get_setting, "pin_hash")
     if stored_hash is None:
         # Safety fallback: set default PIN if missing
         default_hash = hash_pin("1234")
-        update_setting("pin_hash", default_hash)
+        await run_db(update_setting, "pin_hash", default_hash)
         stored_hash = default_hash
 
     if hash_pin(request.pin) != stored_hash:
         raise HTTPException(status_code=401, detail="Falsche PIN")
 
-    _cleanup_sessions()
-    token = secrets.token_hex(32)
-    sessions[token] = datetime.now() + timedelta(hours=SESSION_DURATION_HOURS)
+    token = await run_db(sessions.create)
 
     return {"token": token, "message": "Angemeldet"}
 
@@ -71,22 +64,22 @@ async def logout(request: Request):
     auth_header = request.headers.get("authorization", "")
     if auth_header.startswith("Bearer "):
         token = auth_header[7:]
-        sessions.pop(token, None)
+        await run_db(sessions.revoke, token)
     return {"message": "Abgemeldet"}
 
 
 @router.post("/change-pin")
 async def change_pin(request: ChangePinRequest):
-    stored_hash = get_setting("pin_hash")
+    stored_hash = await run_db(get_setting, "pin_hash")
     if hash_pin(request.current_pin) != stored_hash:
         raise HTTPException(status_code=401, detail="Aktuelle PIN ist falsch")
 
     if len(request.new_pin) < 4:
         raise HTTPException(status_code=400, detail="PIN muss mindestens 4 Zeichen haben")
 
-    update_setting("pin_hash", hash_pin(request.new_pin))
+    await run_db(update_setting, "pin_hash", hash_pin(request.new_pin))
 
     # Invalidate all existing sessions so user must re-login with new PIN
-    sessions.clear()
+    await run_db(sessions.clear)
 
     return {"message": "PIN geändert"}
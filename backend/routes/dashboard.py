@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+
+from ..cache import analytics_cache
+from ..conditional import conditional_get
+from ..database import run_db, read_snapshot, get_settings
+from ..serialization import fast_json
+from .readings import compute_readings, compute_statistics, compute_monthly_comparison
+from .settings import public_settings
+
+router = APIRouter(prefix="/api/dashboard", tags=["dashboard"])
+
+SECTIONS = ("settings", "readings", "statistics", "monthly_comparison")
+
+# What loadData() in app.js requests next to /api/sync (DERIVED_SECTIONS there);
+# readings and settings come from the replica
+DERIVED_SECTIONS = ("statistics", "monthly_comparison")
+
+
+def compute_dashboard(sections: tuple) -> dict:
+    """All requested sections, read from one database snapshot"""
+    result = {}
+    with read_snapshot():
+        settings = get_settings()
+        if "settings" in sections:
+            result["settings"] = public_settings(settings.raw)
+        if "readings" in sections:
+            result["readings"] = compute_readings()
+        if "statistics" in sections:
+            result["statistics"] = compute_statistics(settings)
+        if "monthly_comparison" in sections:
+            result["monthly_comparison"] = compute_monthly_comparison()
+    return result
+
+
+def warm_up():
+    """Fill the cache with the dashboard sections a page load requests"""
+    analytics_cache.get_or_compute(
+        ("dashboard", DERIVED_SECTIONS), lambda: compute_dashboard(DERIVED_SECTIONS)
+    )
+
+
+@router.get("", dependencies=[Depends(conditional_get)])
+async def get_dashboard(response: Response, include: str = ",".join(SECTIONS)):
+    """
+    Everything the dashboard needs in one response. `include` selects a
+    comma-separated subset of: settings, readings, statistics, monthly_comparison.
+    """
+    requested = {s.strip() for s in include.split(",") if s.strip()}
+    unknown = requested - set(SECTIONS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown sections: {', '.join(sorted(unknown))}")
+
+    sections = tuple(s for s in SECTIONS if s in requested)
+    result = await analytics_cache.get_or_run(
+        ("dashboard", sections), lambda: compute_dashboard(sections), run_db
+    )
+    return fast_json(result, response)
@@ -0,0 +1,50 @@
+import os
+
+from fastapi import APIRouter, HTTPException, UploadFile, File
+from starlette.concurrency import run_in_threadpool
+
+from .. import jobs
+from ..importer import EXCEL_EXTENSIONS, CSV_EXTENSIONS, spool_upload
+
+router = APIRouter(prefix="/api/imports", tags=["imports"])
+
+IMPORT_KINDS = {"readings", "intervals"}
+
+
+@router.post("", status_code=202)
+async def submit_import(
+    file: UploadFile = File(...),
+    kind: str = "readings",
+    series: str = "inverter"
+):
+    """
+    Start a background import and return its job id. `kind` is "readings"
+    (Excel/CSV meter readings) or "intervals" (CSV interval export for `series`).
+    """
+    if kind not in IMPORT_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown import kind: {kind}")
+    allowed = CSV_EXTENSIONS if kind == "intervals" else EXCEL_EXTENSIONS + CSV_EXTENSIONS
+    if not file.filename.lower().endswith(allowed):
+        raise HTTPException(status_code=400, detail=f"Only {', '.join(allowed)} files allowed")
+
+    path = await run_in_threadpool(spool_upload, file, os.path.splitext(file.filename)[1])
+    job = await run_in_threadpool(
+        jobs.submit, kind, path, file.filename, series if kind == "intervals" else None
+    )
+    return job.to_dict()
+
+
+@router.get("/{job_id}")
+async def get_import(job_id: str):
+    job = await run_in_threadpool(jobs.get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.delete("/{job_id}")
+async def cancel_import(job_id: str):
+    job = await run_in_threadpool(jobs.cancel, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
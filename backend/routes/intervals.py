@@ -0,0 +1,66 @@
+import io
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+
+from ..cache import analytics_cache
+from ..conditional import conditional_get
+from ..database import run_db, import_intervals, get_interval_series
+from ..downsample import downsample, pick
+from ..intervals import parse_csv, parse_timestamp
+
+router = APIRouter(prefix="/api/intervals", tags=["intervals"])
+
+
+@router.get("", dependencies=[Depends(conditional_get)])
+async def list_intervals(
+    series: str = "inverter",
+    start: str = Query(..., alias="from"),
+    end: str = Query(..., alias="to"),
+    resolution: int = 0,
+    points: Optional[int] = Query(None, ge=3),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$")
+):
+    """
+    Energy per interval between `from` and `to` (epoch or ISO timestamps).
+    `resolution` is the coarsest acceptable bucket size in seconds; the
+    coarsest matching rollup (hour, day, month) is used, else raw samples.
+    `points` caps the series length for charts, downsampled by `method`.
+    """
+    try:
+        start_ts, end_ts = parse_timestamp(start), parse_timestamp(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+    if end_ts <= start_ts:
+        raise HTTPException(status_code=400, detail="'to' must be after 'from'")
+    if not points:
+        return await run_db(get_interval_series, series, start_ts, end_ts, resolution)
+    return await analytics_cache.get_or_run(
+        ('intervals', series, start_ts, end_ts, resolution, points, method),
+        lambda: compute_downsampled(series, start_ts, end_ts, resolution, points, method),
+        run_db
+    )
+
+
+def compute_downsampled(series, start, end, resolution, points, method) -> dict:
+    data = get_interval_series(series, start, end, resolution)
+    keep = downsample(method, data['ts'], data['energy_kwh'], points)
+    return {
+        **data,
+        'ts': pick(keep, data['ts']),
+        'energy_kwh': pick(keep, data['energy_kwh']),
+        'source_points': len(data['ts'])
+    }
+
+
+@router.post("/import")
+async def import_interval_csv(series: str = "inverter", file: UploadFile = File(...)):
+    """Import a CSV of timestamp,energy_kwh rows (15-minute or hourly exports)"""
+    if not file.filename.endswith('.csv'):
+        raise HTTPException(status_code=400, detail="Only CSV files allowed")
+
+    text = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    count = await run_db(import_intervals, series, parse_csv(text))
+    if not count:
+        raise HTTPException(status_code=400, detail="No valid samples found in file")
+    return {"imported": count, "series": series, "message": f"Successfully imported {count} samples"}
@@ -1,30 +1,27 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
-from datetime import datetime
-from openpyxl import load_workbook
-import io
-
+import os
+
+from .. import export
+from ..cache import analytics_cache
+from ..conditional import conditional_get
+from ..serialization import fast_json, to_columnar
+from ..downsample import date_axis, downsample, pick
+from ..importer import (
+    EXCEL_EXTENSIONS, CSV_EXTENSIONS, Rejections, spool_upload, iter_rows, validate_rows
+)
 from ..database import (
-    get_all_readings, add_reading, delete_reading,
-    get_all_settings, import_readings_bulk
+    run_db, add_reading, delete_reading, get_settings, import_readings_stream,
+    get_enriched_readings, get_readings_summary, get_yearly_yields, get_monthly_yields,
+    get_interval_monthly, open_enriched_cursor, READING_FIELDS
 )
 
 router = APIRouter(prefix="/api/readings", tags=["readings"])
 
 
-def calculate_yield(current_reading, prev_reading, date, prev_date, meter_change_date):
-    """Calculate yield handling meter changes"""
-    # Check if this is the first reading after meter change
-    if meter_change_date and date >= meter_change_date and (not prev_date or prev_date < meter_change_date):
-        # First reading after meter change - yield is just the new meter value
-        return current_reading
-    # Check if meter was reset (reading drops significantly)
-    elif prev_reading and current_reading < prev_reading and prev_reading - current_reading > 1000:
-        return current_reading
-    else:
-        return current_reading - (prev_reading or 0)
-
 class ReadingCreate(BaseModel):
     date: str  # Format: YYYY-MM-DD
     meter_reading: float
@@ -37,95 +34,172 @@ class ReadingResponse(BaseModel):
     yield_per_kwp: Optional[float] = None
     revenue: Optional[float] = None
 
-@router.get("")
-async def list_readings():
-    readings = get_all_readings()
-    settings = get_all_settings()
-
-    plant_size = float(settings.get('plant_size_kwp', 4.84))
-    price_per_kwh = float(settings.get('price_per_kwh', 0.518))
-    initial_reading = float(settings.get('initial_meter_reading', 0))
-    meter_change_date = settings.get('meter_change_date', '')
-
-    # Calculate yields
-    enriched = []
-    prev_reading = initial_reading
-    prev_date = ''
-
-    for r in readings:
-        current_reading = r['meter_reading']
-        yield_kwh = calculate_yield(current_reading, prev_reading, r['date'], prev_date, meter_change_date)
-
-        enriched.append({
-            'id': r['id'],
-            'date': r['date'],
-            'meter_reading': r['meter_reading'],
-            'yield_kwh': round(max(0, yield_kwh), 2),
-            'yield_per_kwp': round(max(0, yield_kwh) / plant_size, 2) if plant_size > 0 else 0,
-            'revenue': round(max(0, yield_kwh) * price_per_kwh, 2)
-        })
-        prev_reading = current_reading
-        prev_date = r['date']
+MAX_PAGE_SIZE = 5000
+
+@router.get("", dependencies=[Depends(conditional_get)])
+async def list_readings(
+    response: Response,
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    format: str = Query("rows", pattern="^(rows|columnar)$")
+):
+    """
+    Enriched readings, optionally limited to a from/to date range. With
+    `limit`, pages are keyed on the date: pass the X-Next-Cursor header of
+    one page as `cursor` to get the next. `fields` is a comma-separated
+    projection, e.g. fields=date,yield_kwh. format=columnar returns one
+    array per field instead of one object per reading.
+    """
+    field_list = None
+    if fields:
+        field_list = [f.strip() for f in fields.split(',') if f.strip()]
+        unknown = [f for f in field_list if f not in READING_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        field_list = [f for f in READING_FIELDS if f in field_list]
+
+    key = ('readings', start, end, limit, cursor, tuple(field_list or ()), format)
+    if format == 'columnar':
+        body = await analytics_cache.get_or_run(key, lambda: to_columnar(
+            compute_readings(start, end, cursor, limit, field_list), field_list or list(READING_FIELDS)
+        ), run_db)
+        count, dates = body['count'], body['columns'].get('date')
+    else:
+        body = await analytics_cache.get_or_run(
+            key, lambda: compute_readings(start, end, cursor, limit, field_list), run_db
+        )
+        count, dates = len(body), [body[-1].get('date')] if body else None
+
+    if limit and count == limit:
+        # Cursor is the last date of the page, fetched even if not projected
+        last = (dates and dates[-1]) or await run_db(_last_page_date, start, end, cursor, limit)
+        response.headers['X-Next-Cursor'] = last
+    return fast_json(body, response)
+
+@router.get("/cumulative", dependencies=[Depends(conditional_get)])
+async def get_cumulative(
+    response: Response,
+    points: Optional[int] = Query(None, ge=3),
+    method: str = Query("lttb", pattern="^(lttb|minmax)$")
+):
+    """Running total of the yields by date, downsampled to `points` if given"""
+    result = await analytics_cache.get_or_run(
+        ('cumulative', points, method), lambda: compute_cumulative(points, method), run_db
+    )
+    return fast_json(result, response)
+
+def compute_cumulative(points=None, method='lttb'):
+    dates, totals, total = [], [], 0
+    for r in compute_readings(fields=['date', 'yield_kwh']):
+        total += r['yield_kwh']
+        dates.append(r['date'])
+        totals.append(round(total, 2))
+
+    count = len(dates)
+    if points:
+        keep = downsample(method, date_axis(dates), totals, points)
+        dates, totals = pick(keep, dates), pick(keep, totals)
+    return {'date': dates, 'cumulative_kwh': totals, 'source_points': count}
+
+def compute_readings(start=None, end=None, cursor=None, limit=None, fields=None):
+    readings = get_enriched_readings(start, end, cursor, limit, fields)
+    if not fields or 'yield_kwh' in fields:
+        for r in readings:
+            # The ledger stores REAL; keep emitting 0 rather than 0.0 for no yield
+            r['yield_kwh'] = round(r['yield_kwh'], 2) or 0
+    return readings
+
+def _last_page_date(start, end, cursor, limit):
+    return get_enriched_readings(start, end, cursor, limit, ['date'])[-1]['date']
+
+@router.get("/export")
+async def export_readings(
+    format: str = Query("csv", pattern="^(csv|xlsx|parquet)$"),
+    start: Optional[str] = Query(None, alias="from"),
+    end: Optional[str] = Query(None, alias="to")
+):
+    """
+    Enriched readings as a CSV, XLSX or Parquet download, optionally limited
+    to a from/to date range. Read from the database in batches; CSV and
+    Parquet are sent as they are encoded, XLSX once the workbook is complete.
+    """
+    cursor = await run_db(open_enriched_cursor, start, end)
+    try:
+        exporter = await run_db(export.FORMATS[format], cursor)
+    except ImportError:
+        cursor.connection.close()
+        raise HTTPException(status_code=501, detail=f"{format} export is not available on this server")
+
+    async def body():
+        try:
+            while (chunk := await run_db(exporter.next_chunk)) is not None:
+                if chunk:
+                    yield chunk
+        finally:
+            await run_db(exporter.close)
 
-    return enriched
+    name = '_'.join(['solar-readings', *(d for d in (start, end) if d)])
+    return StreamingResponse(body(), media_type=exporter.media_type, headers={
+        'Content-Disposition': f'attachment; filename="{name}.{exporter.extension}"'
+    })
 
 @router.post("")
 async def create_reading(reading: ReadingCreate):
     try:
-        reading_id = add_reading(reading.date, reading.meter_reading)
+        reading_id = await run_db(add_reading, reading.date, reading.meter_reading)
         return {"id": reading_id, "message": "Reading added successfully"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/{reading_id}")
 async def remove_reading(reading_id: int):
-    delete_reading(reading_id)
+    await run_db(delete_reading, reading_id)
     return {"message": "Reading deleted"}
 
 @router.post("/import-excel")
 async def import_from_excel(file: UploadFile = File(...)):
-    """Import readings from uploaded Excel file"""
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="Only Excel files allowed")
-
-    content = await file.read()
-    wb = load_workbook(io.BytesIO(content), data_only=True)
-    ws = wb.active
+    """
+    Import readings from an uploaded Excel or CSV file and wait for the
+    result. Large files are better sent to /api/imports as a background job.
+    """
+    if not file.filename.lower().endswith(EXCEL_EXTENSIONS + CSV_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only Excel or CSV files allowed")
+
+    path = await run_in_threadpool(spool_upload, file, os.path.splitext(file.filename)[1])
+    rejections = Rejections()
+    try:
+        # Parsing and writing block, so keep them off the event loop
+        imported = await run_db(
+            import_readings_stream, validate_rows(iter_rows(path, file.filename), rejections)
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read file: {e}")
+    finally:
+        os.unlink(path)
 
-    # Find the data rows (looking for dates)
-    readings = []
-    for row in ws.iter_rows(min_row=1, values_only=True):
-        try:
-            date_val = row[0]
-            meter_val = row[1]
-
-            if date_val is None or meter_val is None:
-                continue
-
-            # Check if it's a date
-            if isinstance(date_val, datetime):
-                date_str = date_val.strftime('%Y-%m-%d')
-                if isinstance(meter_val, (int, float)) and meter_val > 0:
-                    readings.append({
-                        'date': date_str,
-                        'meter_reading': float(meter_val)
-                    })
-        except:
-            continue
-
-    if readings:
-        import_readings_bulk(readings)
-        return {"imported": len(readings), "message": f"Successfully imported {len(readings)} readings"}
+    if imported:
+        return {
+            "imported": imported,
+            **rejections.as_dict(),
+            "message": f"Successfully imported {imported} readings"
+        }
 
     raise HTTPException(status_code=400, detail="No valid readings found in file")
 
-@router.get("/statistics")
-async def get_statistics():
+@router.get("/statistics", dependencies=[Depends(conditional_get)])
+async def get_statistics(response: Response):
     """Get aggregated statistics"""
-    readings = get_all_readings()
-    settings = get_all_settings()
+    return fast_json(await analytics_cache.get_or_run('statistics', compute_statistics, run_db), response)
+
+def compute_statistics(settings=None):
+    summary = get_readings_summary()
+    if settings is None:
+        settings = get_settings()
 
-    if not readings:
+    if not summary:
         return {
             "total_yield": 0,
             "total_revenue": 0,
@@ -134,16 +208,16 @@ async def get_statistics():
             "yearly_stats": []
         }
 
-    plant_size = float(settings.get('plant_size_kwp', 4.84))
-    price_per_kwh = float(settings.get('price_per_kwh', 0.518))
-    initial_reading = float(settings.get('initial_meter_reading', 0))
-    expected_yield_per_kwp = float(settings.get('expected_yield_per_kwp', 950))
-    meter_change_date = settings.get('meter_change_date', '')
-    meter_change_offset = float(settings.get('meter_change_offset', 0))
+    plant_size = settings.plant_size_kwp
+    price_per_kwh = settings.price_per_kwh
+    initial_reading = settings.initial_meter_reading
+    expected_yield_per_kwp = settings.expected_yield_per_kwp
+    meter_change_date = settings.meter_change_date
+    meter_change_offset = settings.meter_change_offset
 
     # Calculate total yield accounting for meter change
-    last_reading = readings[-1]['meter_reading']
-    if meter_change_date and readings[-1]['date'] >= meter_change_date:
+    last_reading = summary['last_reading']
+    if meter_change_date and summary['last_date'] >= meter_change_date:
         # After meter change: offset + current reading - initial
         total_yield = meter_change_offset + last_reading - initial_reading
     else:
@@ -151,84 +225,70 @@ async def get_statistics():
 
     total_revenue = total_yield * price_per_kwh
 
-    # Yearly statistics with meter change handling
-    yearly_stats = {}
-    prev_reading = initial_reading
-    prev_date = ''
-
-    for r in readings:
-        year = r['date'][:4]
-        current_reading = r['meter_reading']
-
-        yield_kwh = calculate_yield(current_reading, prev_reading, r['date'], prev_date, meter_change_date)
-
-        if year not in yearly_stats:
-            yearly_stats[year] = {
-                'year': int(year),
-                'yield_kwh': 0,
-                'months': 0,
-                'expected_yield': expected_yield_per_kwp * plant_size
-            }
-
-        yearly_stats[year]['yield_kwh'] += max(0, yield_kwh)
-        yearly_stats[year]['months'] += 1
-        prev_reading = current_reading
-        prev_date = r['date']
-
-    # Calculate performance for each year
-    for year, stats in yearly_stats.items():
-        stats['yield_kwh'] = round(stats['yield_kwh'], 2)
-        stats['yield_per_kwp'] = round(stats['yield_kwh'] / plant_size, 2)
-        stats['revenue'] = round(stats['yield_kwh'] * price_per_kwh, 2)
-        stats['performance_pct'] = round((stats['yield_kwh'] / stats['expected_yield']) * 100, 1)
-
-    yearly_list = sorted(yearly_stats.values(), key=lambda x: x['year'])
+    # Yearly statistics from the ledger rollup
+    yearly_list = []
+    for row in get_yearly_yields():
+        yield_kwh = round(row['yield_kwh'], 2)
+        expected_yield = expected_yield_per_kwp * plant_size
+        yearly_list.append({
+            'year': row['year'],
+            'yield_kwh': yield_kwh,
+            'months': row['months'],
+            'expected_yield': expected_yield,
+            'yield_per_kwp': round(yield_kwh / plant_size, 2),
+            'revenue': round(yield_kwh * price_per_kwh, 2),
+            'performance_pct': round((yield_kwh / expected_yield) * 100, 1)
+        })
 
     # Calculate years active
-    if readings:
-        first_year = int(readings[0]['date'][:4])
-        last_year = int(readings[-1]['date'][:4])
-        years_active = last_year - first_year + 1
-    else:
-        years_active = 0
+    first_year = int(summary['first_date'][:4])
+    last_year = int(summary['last_date'][:4])
+    years_active = last_year - first_year + 1
 
     return {
         "total_yield": round(total_yield, 2),
         "total_yield_per_kwp": round(total_yield / plant_size, 2) if plant_size > 0 else 0,
         "total_revenue": round(total_revenue, 2),
-        "avg_monthly_yield": round(total_yield / len(readings), 2) if readings else 0,
+        "avg_monthly_yield": round(total_yield / summary['count'], 2),
         "years_active": years_active,
         "expected_yearly_yield": round(expected_yield_per_kwp * plant_size, 2),
         "yearly_stats": yearly_list
     }
 
-@router.get("/monthly-comparison")
-async def get_monthly_comparison():
-    """Get monthly comparison data for charts"""
-    readings = get_all_readings()
-    settings = get_all_settings()
-
-    initial_reading = float(settings.get('initial_meter_reading', 0))
-    meter_change_date = settings.get('meter_change_date', '')
+@router.get("/monthly-comparison", dependencies=[Depends(conditional_get)])
+async def get_monthly_comparison(response: Response, series: Optional[str] = None):
+    """
+    Get monthly comparison data for charts. With `series`, totals come from
+    the monthly rollup of that interval series instead of the meter readings.
+    """
+    if series:
+        result = await analytics_cache.get_or_run(
+            ('monthly-comparison', series), lambda: compute_interval_comparison(series), run_db
+        )
+    else:
+        result = await analytics_cache.get_or_run('monthly-comparison', compute_monthly_comparison, run_db)
+    return fast_json(result, response)
 
-    # Organize by month
+def compute_monthly_comparison():
     monthly_data = {}
-    prev_reading = initial_reading
-    prev_date = ''
-
-    for r in readings:
-        date = r['date']
-        year = int(date[:4])
-        month = int(date[5:7])
-        current_reading = r['meter_reading']
+    for row in get_monthly_yields():
+        month = row['month']
+        if month not in monthly_data:
+            monthly_data[month] = {'month': month, 'years': {}}
+        monthly_data[month]['years'][row['year']] = row['yield_kwh'] or 0
 
-        yield_kwh = calculate_yield(current_reading, prev_reading, date, prev_date, meter_change_date)
+    return list(monthly_data.values())
 
+def compute_interval_comparison(series):
+    monthly_data = {}
+    for year, month, energy in get_interval_monthly(series):
         if month not in monthly_data:
             monthly_data[month] = {'month': month, 'years': {}}
-
-        monthly_data[month]['years'][year] = round(max(0, yield_kwh), 2)
-        prev_reading = current_reading
-        prev_date = date
+        monthly_data[month]['years'][year] = round(energy, 2)
 
     return sorted(monthly_data.values(), key=lambda x: x['month'])
+
+@router.get("/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters of the analytics response cache"""
+    return analytics_cache.stats()
@@ -1,67 +1,143 @@
-from fastapi import APIRouter, HTTPException
-import httpx
-from typing import Optional
+from fastapi import APIRouter, HTTPException, Response
+
+from ..database import run_db, get_monthly_yields
+from ..pvgis import UpstreamError, normalize_params, get_reference, sweep, monthly_energy
 
 router = APIRouter(prefix="/api/reference", tags=["reference"])
 
 @router.get("/pvgis")
 async def get_pvgis_data(
+    response: Response,
     lat: float = 48.1351,
     lon: float = 11.5820,
     peakpower: float = 4.84,
-    loss: float = 14
+    loss: float = 14,
+    angle: float = 35,
+    aspect: float = 0
 ):
     """
     Get reference solar yield data from PVGIS (EU JRC)
     https://re.jrc.ec.europa.eu/pvg_tools/en/
     """
-    url = "https://re.jrc.ec.europa.eu/api/v5_2/PVcalc"
-
-    params = {
-        'lat': lat,
-        'lon': lon,
-        'peakpower': peakpower,
-        'loss': loss,
-        'outputformat': 'json',
-        'pvtechchoice': 'crystSi',
-        'mountingplace': 'building',
-        'angle': 35,
-        'aspect': 0
-    }
+    params = normalize_params(lat, lon, peakpower, loss, angle, aspect)
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
-            response = await client.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            outputs = data.get('outputs', {})
-            monthly = outputs.get('monthly', {}).get('fixed', [])
-
-            return {
-                'yearly_yield': outputs.get('totals', {}).get('fixed', {}).get('E_y', 0),
-                'monthly_yields': [
-                    {
-                        'month': m.get('month'),
-                        'yield_kwh': m.get('E_m', 0),
-                        'irradiance': m.get('H_m', 0)
-                    }
-                    for m in monthly
-                ],
-                'location': {
-                    'latitude': lat,
-                    'longitude': lon
-                },
-                'system': {
-                    'peakpower_kwp': peakpower,
-                    'loss_pct': loss
-                }
-            }
-    except httpx.HTTPError as e:
+        data, cache_status = await get_reference(params)
+    except UpstreamError as e:
         raise HTTPException(status_code=502, detail=f"PVGIS API error: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    response.headers['X-Cache'] = cache_status
+    return format_reference(data, params)
+
+def format_reference(data: dict, params: dict) -> dict:
+    outputs = data.get('outputs', {})
+    monthly = outputs.get('monthly', {}).get('fixed', [])
+
+    return {
+        'yearly_yield': outputs.get('totals', {}).get('fixed', {}).get('E_y', 0),
+        'monthly_yields': [
+            {
+                'month': m.get('month'),
+                'yield_kwh': m.get('E_m', 0),
+                'irradiance': m.get('H_m', 0)
+            }
+            for m in monthly
+        ],
+        'location': {
+            'latitude': params['lat'],
+            'longitude': params['lon']
+        },
+        'system': {
+            'peakpower_kwp': params['peakpower'],
+            'loss_pct': params['loss'],
+            'angle': params['angle'],
+            'aspect': params['aspect']
+        }
+    }
+
+MAX_SWEEP_CONFIGS = 200
+
+def _parse_list(value: str, name: str) -> list:
+    try:
+        return [float(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid list for {name}: {value}")
+
+def _measured_monthly_average():
+    """Average measured yield per calendar month (None where no data)"""
+    totals, counts = [0.0] * 12, [0] * 12
+    for row in get_monthly_yields():
+        totals[row['month'] - 1] += row['yield_kwh']
+        counts[row['month'] - 1] += 1
+    return [round(t / c, 2) if c else None for t, c in zip(totals, counts)]
+
+@router.get("/pvgis/sweep")
+async def get_pvgis_sweep(
+    lat: float = 48.1351,
+    lon: float = 11.5820,
+    peakpower: float = 4.84,
+    angles: str = "0,10,20,30,40,50,60,70,80,90",
+    aspects: str = "-90,-60,-45,-30,-15,0,15,30,45,60,90",
+    losses: str = "14"
+):
+    """
+    Reference yields for a grid of tilt (angle), azimuth (aspect, 0 = south)
+    and system loss combinations, fetched concurrently and cached. Results are
+    parallel arrays in grid order (loss, then angle, then aspect); `best` is
+    the configuration whose monthly profile best matches the measured yields.
+    """
+    angle_list = _parse_list(angles, 'angles')
+    aspect_list = _parse_list(aspects, 'aspects')
+    loss_list = _parse_list(losses, 'losses')
+    size = len(angle_list) * len(aspect_list) * len(loss_list)
+    if not size or size > MAX_SWEEP_CONFIGS:
+        raise HTTPException(status_code=400, detail=f"Sweep must have 1 to {MAX_SWEEP_CONFIGS} configurations")
+
+    base = {'lat': lat, 'lon': lon, 'peakpower': peakpower}
+    results = await sweep(base, angle_list, aspect_list, loss_list)
+    measured = await run_db(_measured_monthly_average)
+
+    configs, yearly, monthly, errors = [], [], [], []
+    best = None
+    for params, data, error in results:
+        configs.append([params['angle'], params['aspect'], params['loss']])
+        errors.append(error)
+        if data is None:
+            yearly.append(None)
+            monthly.append(None)
+            continue
+
+        months = monthly_energy(data)
+        yearly.append(data.get('outputs', {}).get('totals', {}).get('fixed', {}).get('E_y', 0))
+        monthly.append(months)
+
+        # Root mean square deviation over months with measurements
+        deviations = [(m - a) ** 2 for m, a in zip(months, measured) if a is not None]
+        if deviations:
+            rmse = round((sum(deviations) / len(deviations)) ** 0.5, 2)
+            if best is None or rmse < best['rmse_kwh']:
+                best = {
+                    'angle': params['angle'],
+                    'aspect': params['aspect'],
+                    'loss': params['loss'],
+                    'yearly_yield': yearly[-1],
+                    'rmse_kwh': rmse
+                }
+
+    return {
+        'location': {'latitude': round(lat, 4), 'longitude': round(lon, 4)},
+        'peakpower_kwp': round(peakpower, 3),
+        'columns': ['angle', 'aspect', 'loss'],
+        'configs': configs,
+        'yearly': yearly,
+        'monthly': monthly,
+        'errors': errors if any(errors) else None,
+        'measured_monthly': measured,
+        'best': best
+    }
+
 @router.get("/typical-yields")
 async def get_typical_yields():
     """
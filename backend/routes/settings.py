@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from ..database import get_all_settings, update_setting
+from ..conditional import conditional_get
+from ..database import run_db, get_all_settings, update_setting, save_settings
 
 router = APIRouter(prefix="/api/settings", tags=["settings"])
 
@@ -13,25 +14,25 @@ class SettingUpdate(BaseModel):
     value: str
 
 
-@router.get("")
+def public_settings(settings: dict) -> dict:
+    return {k: v for k, v in settings.items() if k not in PROTECTED_KEYS}
+
+
+@router.get("", dependencies=[Depends(conditional_get)])
 async def list_settings():
-    settings = get_all_settings()
-    for key in PROTECTED_KEYS:
-        settings.pop(key, None)
-    return settings
+    return public_settings(await run_db(get_all_settings))
 
 
 @router.put("")
 async def update_settings(setting: SettingUpdate):
     if setting.key in PROTECTED_KEYS:
         raise HTTPException(status_code=403, detail="Diese Einstellung kann hier nicht geändert werden")
-    update_setting(setting.key, setting.value)
+    await run_db(update_setting, setting.key, setting.value)
     return {"message": "Setting updated", "key": setting.key}
 
 
 @router.put("/bulk")
 async def update_settings_bulk(settings: dict):
-    filtered = {k: v for k, v in settings.items() if k not in PROTECTED_KEYS}
-    for key, value in filtered.items():
-        update_setting(key, str(value))
+    filtered = {k: str(v) for k, v in settings.items() if k not in PROTECTED_KEYS}
+    await run_db(save_settings, filtered)
     return {"message": "Settings updated", "count": len(filtered)}
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Query
+
+from ..database import run_db, get_changes
+from ..serialization import fast_json
+from .settings import public_settings
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+
+@router.get("")
+async def sync(since: int = Query(0, ge=0)):
+    """
+    Changes since revision `since` for the client's local replica: changed
+    readings (enriched), the dates of deleted readings, changed settings
+    and the revision to ask from next time. since=0 returns everything;
+    with reset=true the client must drop its replica before applying.
+    """
+    changes = await run_db(get_changes, since)
+    for r in changes['readings']:
+        # The ledger stores REAL; keep emitting 0 rather than 0.0 for no yield
+        r['yield_kwh'] = round(r['yield_kwh'], 2) or 0
+    changes['settings'] = public_settings(changes['settings'])
+    return fast_json(changes)
@@ -0,0 +1,88 @@
+"""
+Fast JSON responses and the columnar readings format.
+
+orjson is used when installed, with the standard library as fallback.
+Returning `fast_json(...)` from an endpoint also skips FastAPI's
+jsonable_encoder pass, which dominates serialization time for long lists.
+API responses above GZIP_MINIMUM_SIZE are gzip-compressed on the fly,
+except for formats that are compressed already.
+"""
+import json
+
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipResponder
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with metrics.timed('serialize'):
+            if orjson is not None:
+                # Non-string keys (e.g. years) become strings, as with json.dumps
+                return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+            return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+# Small bodies fit in a packet either way; level 5 is most of level 9's gain
+GZIP_MINIMUM_SIZE = 1024
+GZIP_LEVEL = 5
+
+# XLSX is a zip and Parquet pages are snappy-compressed: gzip only costs CPU
+COMPRESSED_MEDIA_TYPES = {
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'application/vnd.apache.parquet',
+}
+
+
+class APIGZipMiddleware:
+    """gzip for /api/ responses; frontend assets are served precompressed"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not scope["path"].startswith("/api/")
+                or "gzip" not in Headers(scope=scope).get("accept-encoding", "")):
+            return await self.app(scope, receive, send)
+
+        # The media type is known only once the response starts
+        target = None
+
+        async def send_selected(message):
+            nonlocal target
+            if message["type"] == "http.response.start":
+                media_type = Headers(raw=message["headers"]).get("content-type", "").split(";")[0]
+                if media_type in COMPRESSED_MEDIA_TYPES:
+                    target = send
+                else:
+                    responder = GZipResponder(self.app, GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
+                    responder.send = send
+                    target = responder.send_with_gzip
+            await target(message)
+
+        await self.app(scope, receive, send_selected)
+
+
+def fast_json(content, response: Response = None) -> FastJSONResponse:
+    """Serialize content directly, keeping headers set on an injected Response"""
+    headers = None
+    if response is not None:
+        headers = {k: v for k, v in response.headers.items() if k != 'content-length'}
+    return FastJSONResponse(content, headers=headers)
+
+
+def to_columnar(rows: list, fields) -> dict:
+    """Rows of dicts as one array per field: {'count', 'columns': {field: [...]}}"""
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'columns': {field: [r[field] for r in rows] for field in fields}
+    }
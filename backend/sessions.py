@@ -0,0 +1,273 @@
+"""
+Login sessions.
+
+Three interchangeable stores, chosen with the SESSION_BACKEND environment
+variable:
+
+- memory: tokens in this process only; fine for a single worker.
+- sqlite (default): tokens in a database shared by the workers, so every
+  worker accepts them. A small in-process LRU answers repeat lookups.
+- signed: stateless HMAC-signed tokens carrying their expiry and a
+  revocation epoch. Bumping the epoch (on PIN change) invalidates every
+  token; single tokens cannot be revoked.
+
+Each store has `cached(token)`, which answers without I/O when it can and
+returns None otherwise, and `verify(token)`, which may query the database.
+
+The sessions and auth_state tables live in their own file, AUTH_DB_NAME
+next to the main database: a readings import holds the main database's
+write lock until it commits, and a login must not wait for it.
+"""
+import hashlib
+import heapq
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+
+AUTH_DB_NAME = 'auth.db'
+
+# How long a worker trusts what it has cached before asking the database
+# again; bounds how late a logout or PIN change elsewhere takes effect.
+RECHECK_SECONDS = 5
+LRU_SIZE = 1024
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            token_hash TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)')
+
+    # Signing secret and revocation epoch of the signed backend
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS auth_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+
+def move_tables(cursor):
+    """Copy sessions and auth_state from the main database (cursor) into the
+    auth database next to it, then drop them from the main database"""
+    main_file = next(row[2] for row in cursor.execute('PRAGMA database_list') if row[1] == 'main')
+    with closing(sqlite3.connect(Path(main_file).with_name(AUTH_DB_NAME), timeout=5)) as auth, auth:
+        create_tables(auth.cursor())
+        auth.executemany('INSERT OR IGNORE INTO sessions (token_hash, expires_at) VALUES (?, ?)',
+                         cursor.execute('SELECT token_hash, expires_at FROM sessions').fetchall())
+        auth.executemany('INSERT OR IGNORE INTO auth_state (key, value) VALUES (?, ?)',
+                         cursor.execute('SELECT key, value FROM auth_state').fetchall())
+    cursor.execute('DROP TABLE sessions')
+    cursor.execute('DROP TABLE auth_state')
+
+
+class SessionStore:
+    """In-process sessions: token -> expiry, expired from a min-heap"""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl = ttl_seconds
+        self._expiry = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._expiry)
+
+    def create(self) -> str:
+        token = secrets.token_hex(32)
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._expire(now)
+            self._expiry[token] = expires
+            heapq.heappush(self._heap, (expires, token))
+        return token
+
+    def cached(self, token: str):
+        return self.verify(token)
+
+    def verify(self, token: str) -> bool:
+        expires = self._expiry.get(token)
+        if expires is None:
+            return False
+        if expires > time.time():
+            return True
+        self.revoke(token)
+        return False
+
+    def revoke(self, token: str):
+        # The heap entry stays until it comes due and is skipped then
+        with self._lock:
+            self._expiry.pop(token, None)
+
+    def clear(self):
+        with self._lock:
+            self._expiry.clear()
+            self._heap.clear()
+
+    def _expire(self, now: float):
+        """Drop every session that has expired; amortized O(log n) per session"""
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            expires, token = heapq.heappop(heap)
+            if self._expiry.get(token) == expires:
+                del self._expiry[token]
+
+
+class SQLiteSessionStore:
+    """Sessions in the auth database, with an LRU of recently verified tokens"""
+
+    def __init__(self, ttl_seconds: float, connect):
+        self.ttl = ttl_seconds
+        self._connect = connect
+        self._lru = OrderedDict()  # token -> (expires_at, checked_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(token: str) -> str:
+        # Only digests are stored, so the table is useless to a reader
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _remember(self, token: str, expires: float, now: float):
+        with self._lock:
+            self._lru[token] = (expires, now)
+            self._lru.move_to_end(token)
+            while len(self._lru) > LRU_SIZE:
+                self._lru.popitem(last=False)
+
+    def _forget(self, token: str):
+        with self._lock:
+            self._lru.pop(token, None)
+
+    def create(self) -> str:
+        token = secrets.token_hex(32)
+        now = time.time()
+        expires = now + self.ttl
+        conn = self._connect()
+        with conn:
+            # Indexed range delete; only touches rows that have expired
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+            conn.execute('INSERT INTO sessions (token_hash, expires_at) VALUES (?, ?)',
+                         (self._hash(token), expires))
+        self._remember(token, expires, now)
+        return token
+
+    def cached(self, token: str):
+        entry = self._lru.get(token)
+        if entry is None:
+            return None
+        now = time.time()
+        expires, checked_at = entry
+        if expires <= now:
+            return False
+        return True if now - checked_at < RECHECK_SECONDS else None
+
+    def verify(self, token: str) -> bool:
+        row = self._connect().execute(
+            'SELECT expires_at FROM sessions WHERE token_hash = ?', (self._hash(token),)
+        ).fetchone()
+        now = time.time()
+        if row is None or row[0] <= now:
+            self._forget(token)
+            return False
+        self._remember(token, row[0], now)
+        return True
+
+    def revoke(self, token: str):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM sessions WHERE token_hash = ?', (self._hash(token),))
+        self._forget(token)
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('DELETE FROM sessions')
+        with self._lock:
+            self._lru.clear()
+
+
+class SignedSessionStore:
+    """
+    Stateless tokens: "<expires>.<epoch>.<hmac>". The secret comes from
+    SESSION_SECRET or is generated once and kept in auth_state, so all
+    workers share it.
+    """
+
+    def __init__(self, ttl_seconds: float, connect):
+        self.ttl = ttl_seconds
+        self._connect = connect
+        self._secret = os.environ.get('SESSION_SECRET', '').encode() or None
+        self._epoch = None
+        self._epoch_checked = 0.0
+
+    def _load(self):
+        conn = self._connect()
+        if self._secret is None:
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO auth_state (key, value) VALUES ('session_secret', ?)",
+                             (secrets.token_hex(32),))
+            self._secret = conn.execute(
+                "SELECT value FROM auth_state WHERE key = 'session_secret'"
+            ).fetchone()[0].encode()
+        row = conn.execute("SELECT value FROM auth_state WHERE key = 'session_epoch'").fetchone()
+        self._epoch = int(row[0]) if row else 0
+        self._epoch_checked = time.time()
+
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self._secret, payload.encode(), hashlib.sha256).hexdigest()
+
+    def _check(self, token: str) -> bool:
+        try:
+            expires, epoch, signature = token.split('.')
+            # As bytes: compare_digest rejects str with non-ASCII characters
+            valid = hmac.compare_digest(signature.encode(), self._sign(f'{expires}.{epoch}').encode())
+            return valid and int(epoch) == self._epoch and int(expires) > time.time()
+        except ValueError:
+            return False
+
+    def create(self) -> str:
+        self._load()
+        payload = f'{int(time.time() + self.ttl)}.{self._epoch}'
+        return f'{payload}.{self._sign(payload)}'
+
+    def cached(self, token: str):
+        if self._epoch is None or time.time() - self._epoch_checked >= RECHECK_SECONDS:
+            return None
+        return self._check(token)
+
+    def verify(self, token: str) -> bool:
+        self._load()
+        return self._check(token)
+
+    def revoke(self, token: str):
+        # Nothing is stored per token; the client discards it on logout
+        pass
+
+    def clear(self):
+        """Invalidate every issued token by bumping the revocation epoch"""
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO auth_state (key, value) VALUES ('session_epoch', '0')")
+            conn.execute("UPDATE auth_state SET value = CAST(value AS INTEGER) + 1 WHERE key = 'session_epoch'")
+        self._load()
+
+
+def open_store(backend: str, ttl_seconds: float, connect):
+    """Session store for a SESSION_BACKEND name"""
+    if backend == 'memory':
+        return SessionStore(ttl_seconds)
+    if backend == 'sqlite':
+        return SQLiteSessionStore(ttl_seconds, connect)
+    if backend == 'signed':
+        return SignedSessionStore(ttl_seconds, connect)
+    raise ValueError(f"Unknown session backend: {backend}")
@@ -0,0 +1,59 @@
+"""
+Typed settings snapshot.
+
+The settings table is read once into a `Settings` object with the numeric
+values already parsed. database.py keeps one snapshot in memory and drops
+it whenever settings are written, here or (via PRAGMA data_version) by
+another process.
+"""
+from . import ledger
+from .yield_engine import YieldParams
+
+# Numeric settings and the defaults used when a key is missing
+FLOAT_SETTINGS = {
+    'plant_size_kwp': 4.84,
+    'price_per_kwh': 0.518,
+    'expected_yield_per_kwp': 950,
+    'initial_meter_reading': 0,
+    'meter_change_offset': 0,
+}
+
+
+class Settings:
+    """Read-only view of the settings table with typed accessors"""
+
+    def __init__(self, raw: dict):
+        self.raw = raw
+        self.plant_size_kwp = float(raw.get('plant_size_kwp', FLOAT_SETTINGS['plant_size_kwp']))
+        self.price_per_kwh = float(raw.get('price_per_kwh', FLOAT_SETTINGS['price_per_kwh']))
+        self.expected_yield_per_kwp = float(raw.get('expected_yield_per_kwp', FLOAT_SETTINGS['expected_yield_per_kwp']))
+        self.initial_meter_reading = float(raw.get('initial_meter_reading', FLOAT_SETTINGS['initial_meter_reading']))
+        self.meter_change_offset = float(raw.get('meter_change_offset', FLOAT_SETTINGS['meter_change_offset']))
+        # ISO dates, compared as strings against reading dates
+        self.meter_change_date = raw.get('meter_change_date', '')
+        self.start_date = raw.get('start_date', '')
+        self.pin_hash = raw.get('pin_hash')
+        self.yield_params = YieldParams.from_settings(raw)
+
+    @property
+    def expected_yearly_yield(self) -> float:
+        return self.expected_yield_per_kwp * self.plant_size_kwp
+
+    def get(self, key: str, default=None):
+        return self.raw.get(key, default)
+
+
+def load(conn) -> Settings:
+    rows = conn.execute('SELECT key, value FROM settings').fetchall()
+    return Settings({row['key']: row['value'] for row in rows})
+
+
+def update(conn, values: dict):
+    """Write all values in one transaction, rebuilding the ledger at most once"""
+    with conn:
+        conn.executemany('''
+            INSERT OR REPLACE INTO settings (key, value, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+        ''', values.items())
+        if ledger.LEDGER_SETTINGS.intersection(values):
+            ledger.rebuild(conn)
@@ -0,0 +1,176 @@
+"""
+Shared yield engine.
+
+Readings are loaded once into columns (dates, meter values) and turned into
+yields in a single pass, together with the yearly totals and the
+month x year matrix. NumPy is used when installed; the pure-Python path
+produces bit-identical results and is used otherwise.
+"""
+from typing import NamedTuple
+
+# NumPy is optional and slow to import, so it is loaded on first use
+np = None
+_numpy_checked = False
+
+# Readings dropping by more than this are treated as a meter reset
+RESET_THRESHOLD_KWH = 1000
+
+
+class YieldParams(NamedTuple):
+    initial_reading: float
+    meter_change_date: str
+    plant_size: float
+    price_per_kwh: float
+
+    @classmethod
+    def from_settings(cls, settings: dict):
+        return cls(
+            float(settings.get('initial_meter_reading', 0)),
+            settings.get('meter_change_date', ''),
+            float(settings.get('plant_size_kwp', 4.84)),
+            float(settings.get('price_per_kwh', 0.518)),
+        )
+
+
+def _numpy():
+    """The numpy module, imported on the first call, or None if not installed"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:  # optional dependency
+            pass
+        _numpy_checked = True
+    return np
+
+
+def calculate_yield(current_reading, prev_reading, date, prev_date, meter_change_date):
+    """Calculate yield handling meter changes"""
+    # Check if this is the first reading after meter change
+    if meter_change_date and date >= meter_change_date and (not prev_date or prev_date < meter_change_date):
+        # First reading after meter change - yield is just the new meter value
+        return current_reading
+    # Check if meter was reset (reading drops significantly)
+    elif prev_reading and current_reading < prev_reading and prev_reading - current_reading > RESET_THRESHOLD_KWH:
+        return current_reading
+    else:
+        return current_reading - (prev_reading or 0)
+
+
+def load_columns(rows):
+    """Split reading rows into parallel (ids, dates, meter_readings) lists"""
+    ids, dates, meters = [], [], []
+    for r in rows:
+        ids.append(r['id'])
+        dates.append(r['date'])
+        meters.append(r['meter_reading'])
+    return ids, dates, meters
+
+
+def compute_yields(dates, meters, initial_reading, meter_change_date,
+                   prev_date='', prev_reading=None, use_numpy=None) -> list:
+    """
+    Non-negative yield of each reading. prev_date/prev_reading seed the
+    reading before dates[0]; without them the initial meter reading is used.
+    """
+    if prev_reading is None:
+        prev_reading = initial_reading
+    if use_numpy is None:
+        use_numpy = _numpy() is not None
+    if not dates:
+        return []
+    if use_numpy:
+        return _compute_yields_numpy(dates, meters, meter_change_date, prev_date, prev_reading)
+
+    yields = []
+    for date, current in zip(dates, meters):
+        yields.append(max(0.0, calculate_yield(current, prev_reading, date, prev_date, meter_change_date)))
+        prev_reading = current
+        prev_date = date
+    return yields
+
+
+def _compute_yields_numpy(dates, meters, meter_change_date, prev_date, prev_reading):
+    _numpy()
+    current = np.asarray(meters, dtype=np.float64)
+    prev = np.empty_like(current)
+    prev[0] = prev_reading
+    prev[1:] = current[:-1]
+
+    # First reading on or after the meter change counts from zero
+    if meter_change_date:
+        day = np.asarray(dates)
+        prev_day = np.empty(len(dates), dtype=day.dtype)
+        prev_day[0] = prev_date
+        prev_day[1:] = day[:-1]
+        changed = (day >= meter_change_date) & ((prev_day == '') | (prev_day < meter_change_date))
+    else:
+        changed = np.zeros(len(dates), dtype=bool)
+
+    # A large drop means the meter was reset
+    reset = (prev != 0) & (current < prev) & (prev - current > RESET_THRESHOLD_KWH)
+
+    yields = np.where(changed | reset, current, current - prev)
+    return np.maximum(0.0, yields).tolist()
+
+
+def aggregate(dates, yields):
+    """
+    Yearly totals {year: (yield_kwh, readings)} and the month x year matrix
+    {(month, year): yield_kwh} (last reading of each month, rounded).
+    Dates must be sorted; totals are summed in date order.
+    """
+    yearly = {}
+    monthly = {}
+    if not dates:
+        return yearly, monthly
+
+    if _numpy() is not None:
+        day = np.asarray(dates)
+        values = np.asarray(yields, dtype=np.float64)
+        years = day.astype('<U4')
+        months = day.astype('<U7')
+
+        # Segment boundaries of each year; cumsum adds sequentially
+        starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]])
+        ends = np.r_[starts[1:], len(dates)]
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            yearly[int(dates[start][:4])] = (np.cumsum(values[start:end])[-1].item(), end - start)
+
+        for i in np.flatnonzero(np.r_[months[1:] != months[:-1], True]).tolist():
+            monthly[(int(dates[i][5:7]), int(dates[i][:4]))] = round(yields[i], 2)
+        return yearly, monthly
+
+    for date, value in zip(dates, yields):
+        year = int(date[:4])
+        total, count = yearly.get(year, (0, 0))
+        yearly[year] = (total + value, count + 1)
+        monthly[(int(date[5:7]), year)] = round(value, 2)
+    return yearly, monthly
+
+
+def run(rows, params: YieldParams, prev_date='', prev_reading=None) -> dict:
+    """
+    One pass over the readings producing the enriched rows, yearly totals
+    and month x year matrix.
+    """
+    ids, dates, meters = load_columns(rows)
+    yields = compute_yields(dates, meters, params.initial_reading, params.meter_change_date,
+                            prev_date, prev_reading)
+    plant_size = params.plant_size
+    price_per_kwh = params.price_per_kwh
+
+    enriched = [
+        {
+            'id': reading_id,
+            'date': date,
+            'meter_reading': meter,
+            'yield_kwh': value,
+            'yield_per_kwp': round(value / plant_size, 2) if plant_size > 0 else 0,
+            'revenue': round(value * price_per_kwh, 2)
+        }
+        for reading_id, date, meter, value in zip(ids, dates, meters, yields)
+    ]
+    yearly, monthly = aggregate(dates, yields)
+    return {'enriched': enriched, 'yearly': yearly, 'monthly': monthly}
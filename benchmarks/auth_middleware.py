@@ -0,0 +1,107 @@
+"""
+Per-request overhead of the auth middleware.
+
+Compares the previous BaseHTTPMiddleware implementation with the plain
+ASGI AuthMiddleware on an app with a single trivial endpoint, calling the
+ASGI app directly so no network or server time is included.
+
+    python benchmarks/auth_middleware.py [requests]
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Measure the middleware itself, not session storage
+os.environ.setdefault("SESSION_BACKEND", "memory")
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+from backend.main import AuthMiddleware
+from backend.routes.auth import sessions, verify_session
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """The middleware as it was before, for comparison"""
+    OPEN_PATHS = {"/api/auth/login", "/api/health"}
+
+    async def dispatch(self, request, call_next):
+        path = request.url.path
+        if request.method == "OPTIONS" or not path.startswith("/api/") or path in self.OPEN_PATHS:
+            return await call_next(request)
+        auth_header = request.headers.get("authorization", "")
+        if not auth_header.startswith("Bearer "):
+            return JSONResponse(status_code=401, content={"detail": "Nicht angemeldet"})
+        if not await verify_session(auth_header[7:]):
+            return JSONResponse(status_code=401, content={"detail": "Sitzung abgelaufen"})
+        return await call_next(request)
+
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+
+def build_app(middleware=None):
+    app = Starlette(routes=[Route("/api/ping", ok)])
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+
+async def drive(app, headers, count: int) -> float:
+    """Seconds per request for `count` sequential GET /api/ping calls"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/api/ping", "raw_path": b"/api/ping",
+        "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 8000),
+    }
+
+    async def send(message):
+        pass
+
+    def receiver():
+        # The request body once, then nothing until the response is done
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+        return receive
+
+    start = time.perf_counter()
+    for _ in range(count):
+        await app(dict(scope), receiver(), send)
+    return (time.perf_counter() - start) / count
+
+
+async def main(count: int):
+    # Enough sessions that a full scan per request would show up
+    for _ in range(10000):
+        sessions.create()
+    headers = [(b"authorization", f"Bearer {sessions.create()}".encode())]
+
+    apps = {
+        "no middleware": build_app(),
+        "BaseHTTPMiddleware": build_app(LegacyAuthMiddleware),
+        "ASGI AuthMiddleware": build_app(AuthMiddleware),
+    }
+    for app in apps.values():
+        await drive(app, headers, 200)  # warm-up
+
+    baseline = None
+    for name, app in apps.items():
+        per_request = await drive(app, headers, count)
+        baseline = per_request if baseline is None else baseline
+        print(f"{name:22s} {per_request * 1e6:8.1f} us/request  (+{(per_request - baseline) * 1e6:.1f} us)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
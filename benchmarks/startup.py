@@ -0,0 +1,70 @@
+"""
+Cold start time of a worker process.
+
+Each run starts a fresh interpreter and reports how long `import
+backend.main` takes and how long the app lifespan startup (schema check,
+ledger check, cache warm-up) takes after it, against a throwaway copy of
+the database. Also lists which optional heavy modules were loaded.
+
+    python benchmarks/startup.py [runs] [database]
+"""
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+CHILD = r'''
+import asyncio, json, sys, time
+sys.path.insert(0, sys.argv[1])
+start = time.perf_counter()
+import backend.main
+imported = time.perf_counter()
+from backend import database
+database.DB_PATH = sys.argv[2]
+
+async def lifespan():
+    async with backend.main.app.router.lifespan_context(backend.main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(lifespan())
+print(json.dumps({
+    "import": imported - start,
+    "startup": ready - imported,
+    "heavy": [m for m in ("numpy", "openpyxl", "httpx") if m in sys.modules],
+}))
+'''
+
+
+def run_once(db_path: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, str(ROOT), db_path],
+        check=True, capture_output=True, text=True, env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(runs: int, source_db: str = None):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "solar_data.db")
+        if source_db:
+            shutil.copy(source_db, db_path)
+
+        first = run_once(db_path)
+        print(f"first start (migrates):  import {first['import'] * 1000:6.1f} ms"
+              f"  startup {first['startup'] * 1000:6.1f} ms")
+
+        results = [run_once(db_path) for _ in range(runs)]
+        imports = statistics.median(r["import"] for r in results) * 1000
+        startups = statistics.median(r["startup"] for r in results) * 1000
+        print(f"warm database (median of {runs}): import {imports:6.1f} ms  startup {startups:6.1f} ms")
+        print(f"heavy modules loaded at startup: {', '.join(results[-1]['heavy']) or 'none'}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5, sys.argv[2] if len(sys.argv) > 2 else None)
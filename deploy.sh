@@ -13,7 +13,10 @@ mkdir -p "$BACKUP_DIR"
 # Backup database before deployment
 if [ -f "$APP_DIR/backend/solar_data.db" ]; then
     BACKUP_FILE="$BACKUP_DIR/solar_data_$(date +%Y%m%d_%H%M%S).db"
-    cp "$APP_DIR/backend/solar_data.db" "$BACKUP_FILE"
+    # The database runs in WAL mode: recent commits may still be in
+    # solar_data.db-wal, so copy through SQLite's online backup, not cp
+    python3 -c 'import sqlite3, sys; sqlite3.connect(sys.argv[1]).backup(sqlite3.connect(sys.argv[2]))' \
+        "$APP_DIR/backend/solar_data.db" "$BACKUP_FILE"
     echo "Database backed up to $BACKUP_FILE"
 
     # Keep only last 10 backups
@@ -18,20 +18,38 @@ function clearAuthToken() {
 // Callback for when auth is required (set by app.js)
 let onAuthRequired = null;
 
+// Last ETag and parsed body per GET url, for If-None-Match revalidation
+const etagCache = new Map();
+const API_CACHE_NAME = 'solar-tracker-api';
+
+// Drop cached API data (memory and service worker cache), e.g. on logout
+function clearApiCache() {
+    etagCache.clear();
+    if (window.caches) caches.delete(API_CACHE_NAME);
+}
+
 async function apiRequest(endpoint, options = {}) {
     const url = `${API_BASE}${endpoint}`;
     const token = getAuthToken();
+    const method = (options.method || 'GET').toUpperCase();
+    const cached = method === 'GET' ? etagCache.get(url) : null;
     const headers = {
         'Content-Type': 'application/json',
         ...(token ? { 'Authorization': `Bearer ${token}` } : {}),
+        ...(cached ? { 'If-None-Match': cached.etag } : {}),
     };
 
     const mergedOptions = { ...options, headers: { ...headers, ...options.headers } };
 
     const response = await fetch(url, mergedOptions);
 
+    if (response.status === 304 && cached) {
+        return cached.data;
+    }
+
     if (response.status === 401) {
         clearAuthToken();
+        clearApiCache();
         if (onAuthRequired) onAuthRequired();
         throw new Error('Nicht angemeldet');
     }
@@ -41,6 +59,40 @@ async function apiRequest(endpoint, options = {}) {
         throw new Error(error.detail || `HTTP ${response.status}`);
     }
 
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (method === 'GET' && etag) {
+        etagCache.set(url, { etag, data });
+    }
+    return data;
+}
+
+// Build a query string from an object, skipping empty values
+function toQuery(params = {}) {
+    const entries = Object.entries(params).filter(([, v]) => v !== undefined && v !== null && v !== '');
+    return entries.length ? '?' + new URLSearchParams(entries).toString() : '';
+}
+
+// Multipart upload (no JSON content type so the browser sets the boundary)
+async function uploadFile(endpoint, file) {
+    const formData = new FormData();
+    formData.append('file', file);
+    const token = getAuthToken();
+    const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
+    const response = await fetch(`${API_BASE}${endpoint}`, {
+        method: 'POST',
+        headers,
+        body: formData
+    });
+    if (response.status === 401) {
+        clearAuthToken();
+        if (onAuthRequired) onAuthRequired();
+        throw new Error('Nicht angemeldet');
+    }
+    if (!response.ok) {
+        const error = await response.json().catch(() => ({ detail: 'Upload failed' }));
+        throw new Error(error.detail);
+    }
     return response.json();
 }
 
@@ -68,35 +120,38 @@ const authApi = {
 
 // Readings API
 const readingsApi = {
-    getAll: () => apiRequest('/readings'),
+    // params: { from, to, limit, cursor, fields } - all optional
+    getAll: (params) => apiRequest(`/readings${toQuery(params)}`),
+    // Same rows as { count, columns: { field: [...] } } - smaller and faster to parse
+    getColumns: (params) => apiRequest(`/readings${toQuery({ ...params, format: 'columnar' })}`),
     getStatistics: () => apiRequest('/readings/statistics'),
+    // { date: [...], cumulative_kwh: [...] }, downsampled server-side to `points`
+    getCumulative: (points) => apiRequest(`/readings/cumulative${toQuery({ points })}`),
     getMonthlyComparison: () => apiRequest('/readings/monthly-comparison'),
     create: (data) => apiRequest('/readings', {
         method: 'POST',
         body: JSON.stringify(data)
     }),
     delete: (id) => apiRequest(`/readings/${id}`, { method: 'DELETE' }),
-    importExcel: async (file) => {
-        const formData = new FormData();
-        formData.append('file', file);
-        const token = getAuthToken();
-        const headers = token ? { 'Authorization': `Bearer ${token}` } : {};
-        const response = await fetch(`${API_BASE}/readings/import-excel`, {
-            method: 'POST',
-            headers,
-            body: formData
-        });
-        if (response.status === 401) {
-            clearAuthToken();
-            if (onAuthRequired) onAuthRequired();
-            throw new Error('Nicht angemeldet');
-        }
-        if (!response.ok) {
-            const error = await response.json().catch(() => ({ detail: 'Upload failed' }));
-            throw new Error(error.detail);
-        }
-        return response.json();
-    }
+    importExcel: (file) => uploadFile('/readings/import-excel', file)
+};
+
+// Background import jobs
+const importsApi = {
+    submit: (file, kind = 'readings', series) =>
+        uploadFile(`/imports${toQuery({ kind, series })}`, file),
+    status: (id) => apiRequest(`/imports/${id}`),
+    cancel: (id) => apiRequest(`/imports/${id}`, { method: 'DELETE' })
+};
+
+// Dashboard API: settings, readings, statistics and monthly comparison in one request
+const dashboardApi = {
+    get: (sections) => apiRequest(`/dashboard${toQuery({ include: sections && sections.join(',') })}`)
+};
+
+// Delta sync: readings and settings changed after revision `rev` (0 = all)
+const syncApi = {
+    since: (rev) => apiRequest(`/sync${toQuery({ since: rev })}`)
 };
 
 // Settings API
@@ -116,5 +171,8 @@ const settingsApi = {
 const referenceApi = {
     getPvgis: (lat, lon, peakpower) =>
         apiRequest(`/reference/pvgis?lat=${lat}&lon=${lon}&peakpower=${peakpower}`),
+    // grid: { angles, aspects, losses } as comma-separated strings, all optional
+    getPvgisSweep: (lat, lon, peakpower, grid = {}) =>
+        apiRequest(`/reference/pvgis/sweep${toQuery({ lat, lon, peakpower, ...grid })}`),
     getTypicalYields: () => apiRequest('/reference/typical-yields')
 };
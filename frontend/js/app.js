@@ -72,6 +72,8 @@ function setupLogout() {
     document.getElementById('logout-btn').addEventListener('click', async () => {
         try { await authApi.logout(); } catch {}
         clearAuthToken();
+        clearApiCache();
+        replica.clear().catch(() => {});
         showLoginScreen();
     });
 }
@@ -200,6 +202,8 @@ function setupImport() {
     });
 }
 
+const IMPORT_POLL_MS = 1000;
+
 async function importFile(file) {
     const status = document.getElementById('import-status');
     status.classList.remove('hidden', 'text-red-500', 'text-green-500');
@@ -207,8 +211,24 @@ async function importFile(file) {
     status.classList.add('text-gray-500');
 
     try {
-        const result = await readingsApi.importExcel(file);
-        status.textContent = result.message;
+        // Runs as a background job on the server; poll until it finishes
+        let job = await importsApi.submit(file);
+        while (job.status === 'queued' || job.status === 'running') {
+            status.textContent = `Importiere... ${formatNumber(job.parsed)} Zeilen gelesen, ${formatNumber(job.inserted)} gespeichert`;
+            await new Promise(resolve => setTimeout(resolve, IMPORT_POLL_MS));
+            job = await importsApi.status(job.id);
+        }
+
+        if (job.status !== 'done') {
+            throw new Error(job.error || 'Import abgebrochen');
+        }
+        if (job.inserted === 0) {
+            throw new Error('Keine gültigen Einträge in der Datei gefunden');
+        }
+
+        status.textContent = job.rejected_count
+            ? `${formatNumber(job.inserted)} Einträge importiert (${job.rejected_count} Zeilen übersprungen)`
+            : `${formatNumber(job.inserted)} Einträge importiert`;
         status.classList.remove('text-gray-500');
         status.classList.add('text-green-500');
         await loadData();
@@ -219,22 +239,47 @@ async function importFile(file) {
     }
 }
 
-// Load all data
+// Dashboard sections not kept in the replica (warmed by the server at startup)
+const DERIVED_SECTIONS = ['statistics', 'monthly_comparison'];
+
+// Load all data: render the local replica at once, then fetch what changed
 async function loadData() {
     try {
-        [currentSettings, currentReadings, currentStats, monthlyComparison] = await Promise.all([
-            settingsApi.getAll(),
-            readingsApi.getAll(),
-            readingsApi.getStatistics(),
-            readingsApi.getMonthlyComparison()
-        ]);
-
-        updateUI();
+        const local = await replica.load();
+        if (local.rev && local.derived) showData(local);
+
+        const changed = await replica.sync(local.rev);
+        if (changed || !local.derived) {
+            // Statistics depend on every reading, so they're refetched whole
+            const derived = await dashboardApi.get(DERIVED_SECTIONS);
+            await replica.saveDerived(derived);
+            // Unchanged readings and settings are the ones already loaded
+            showData(changed ? await replica.load() : { ...local, derived });
+        }
     } catch (err) {
-        console.error('Error loading data:', err);
+        console.error('Sync failed, loading everything:', err);
+        try {
+            const dashboard = await dashboardApi.get();
+            showData({
+                readings: dashboard.readings,
+                settings: dashboard.settings,
+                derived: dashboard,
+            });
+        } catch (err) {
+            console.error('Error loading data:', err);
+        }
     }
 }
 
+function showData({ readings, settings, derived }) {
+    currentSettings = settings;
+    currentReadings = readings;
+    currentStats = derived.statistics;
+    monthlyComparison = derived.monthly_comparison;
+
+    updateUI();
+}
+
 // Update UI
 function updateUI() {
     // Summary cards
@@ -326,7 +371,7 @@ function updateYearlyTable() {
     const tbody = document.getElementById('yearly-table');
     const yearlyStats = currentStats.yearly_stats || [];
 
-    tbody.innerHTML = yearlyStats.reverse().map(s => `
+    tbody.innerHTML = [...yearlyStats].reverse().map(s => `
         <tr class="border-b">
             <td class="py-2">${s.year}</td>
             <td class="text-right">${formatNumber(s.yield_kwh)} kWh</td>
@@ -360,12 +405,16 @@ function renderDashboardCharts() {
     }
 }
 
-function renderCharts() {
+async function renderCharts() {
     if (currentReadings.length > 0) {
-        createCumulativeChart(
-            document.getElementById('cumulative-chart').getContext('2d'),
-            currentReadings
-        );
+        // No more points than the canvas has pixels
+        const canvas = document.getElementById('cumulative-chart');
+        try {
+            const series = await readingsApi.getCumulative(Math.max(canvas.clientWidth, 100));
+            createCumulativeChart(canvas.getContext('2d'), series);
+        } catch (err) {
+            console.error('Cumulative chart failed:', err);
+        }
     }
 
     if (monthlyComparison.length > 0) {
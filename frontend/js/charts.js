@@ -95,16 +95,12 @@ function createMonthlyChart(ctx, readings, year) {
     });
 }
 
-function createCumulativeChart(ctx, readings) {
+// series: { date, cumulative_kwh } from /api/readings/cumulative
+function createCumulativeChart(ctx, series) {
     destroyChart('cumulative');
 
-    const labels = readings.map(r => r.date);
-    const cumulative = [];
-    let sum = 0;
-    readings.forEach(r => {
-        sum += r.yield_kwh;
-        cumulative.push(sum);
-    });
+    const labels = series.date;
+    const cumulative = series.cumulative_kwh;
 
     chartInstances['cumulative'] = new Chart(ctx, {
         type: 'line',
@@ -0,0 +1,109 @@
+// Local replica of readings and settings in IndexedDB, kept current with
+// deltas from /api/sync. The app renders from it immediately on start and
+// then asks the server only for rows changed since the stored revision.
+
+const REPLICA_DB = 'solar-tracker';
+const REPLICA_VERSION = 1;
+
+const replica = {
+    _db: null,
+
+    open() {
+        if (!this._db) {
+            this._db = new Promise((resolve, reject) => {
+                const request = indexedDB.open(REPLICA_DB, REPLICA_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('readings', { keyPath: 'date' });
+                    db.createObjectStore('settings', { keyPath: 'key' });
+                    // rev, plus the last statistics and monthly comparison
+                    db.createObjectStore('meta');
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+        return this._db;
+    },
+
+    // { rev, readings (date order), settings, derived } - rev 0 when empty
+    async load() {
+        const db = await this.open();
+        const tx = db.transaction(['readings', 'settings', 'meta'], 'readonly');
+        const [readings, settings, rev, derived] = await Promise.all([
+            requestResult(tx.objectStore('readings').getAll()),
+            requestResult(tx.objectStore('settings').getAll()),
+            requestResult(tx.objectStore('meta').get('rev')),
+            requestResult(tx.objectStore('meta').get('derived')),
+        ]);
+        return {
+            rev: rev || 0,
+            readings,  // getAll returns them ordered by key, i.e. by date
+            settings: Object.fromEntries(settings.map(s => [s.key, s.value])),
+            derived: derived || null,
+        };
+    },
+
+    // Apply a /api/sync response; returns true if anything changed
+    async apply(delta) {
+        const changed = delta.reset || delta.readings.length > 0 || delta.deleted.length > 0
+            || Object.keys(delta.settings).length > 0;
+        const db = await this.open();
+        const tx = db.transaction(['readings', 'settings', 'meta'], 'readwrite');
+        const readings = tx.objectStore('readings');
+        const settings = tx.objectStore('settings');
+        const meta = tx.objectStore('meta');
+        if (delta.reset) {
+            readings.clear();
+            settings.clear();
+            meta.delete('derived');
+        }
+        delta.deleted.forEach(date => readings.delete(date));
+        delta.readings.forEach(r => readings.put(r));
+        Object.entries(delta.settings).forEach(([key, value]) => settings.put({ key, value }));
+        meta.put(delta.rev, 'rev');
+        await transactionDone(tx);
+        return changed;
+    },
+
+    async saveDerived(derived) {
+        const db = await this.open();
+        const tx = db.transaction('meta', 'readwrite');
+        tx.objectStore('meta').put(derived, 'derived');
+        await transactionDone(tx);
+    },
+
+    // The stored revision, without reading the readings
+    async rev() {
+        const db = await this.open();
+        const tx = db.transaction('meta', 'readonly');
+        return (await requestResult(tx.objectStore('meta').get('rev'))) || 0;
+    },
+
+    // Fetch and apply the changes since `rev` (default: the stored revision)
+    async sync(rev) {
+        if (rev === undefined) rev = await this.rev();
+        return this.apply(await syncApi.since(rev));
+    },
+
+    async clear() {
+        const db = await this.open();
+        const tx = db.transaction(['readings', 'settings', 'meta'], 'readwrite');
+        ['readings', 'settings', 'meta'].forEach(name => tx.objectStore(name).clear());
+        await transactionDone(tx);
+    }
+};
+
+function requestResult(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function transactionDone(tx) {
+    return new Promise((resolve, reject) => {
+        tx.oncomplete = () => resolve();
+        tx.onerror = tx.onabort = () => reject(tx.error);
+    });
+}
@@ -1,15 +1,19 @@
-const CACHE_NAME = 'solar-tracker-v1';
-const ASSETS = [
+// Filled in by the server with content hashes and fingerprinted URLs
+const PRECACHE_VERSION = 'dev';
+const PRECACHE_ASSETS = [
     '/',
     '/static/js/api.js',
+    '/static/js/replica.js',
     '/static/js/charts.js',
     '/static/js/app.js',
     '/static/icon-192.svg'
 ];
+const CACHE_NAME = `solar-tracker-${PRECACHE_VERSION}`;
+const API_CACHE_NAME = 'solar-tracker-api';
 
 self.addEventListener('install', (event) => {
     event.waitUntil(
-        caches.open(CACHE_NAME).then((cache) => cache.addAll(ASSETS))
+        caches.open(CACHE_NAME).then((cache) => cache.addAll(PRECACHE_ASSETS))
     );
     self.skipWaiting();
 });
@@ -17,7 +21,7 @@ self.addEventListener('install', (event) => {
 self.addEventListener('activate', (event) => {
     event.waitUntil(
         caches.keys().then((keys) =>
-            Promise.all(keys.filter((k) => k !== CACHE_NAME).map((k) => caches.delete(k)))
+            Promise.all(keys.filter((k) => k !== CACHE_NAME && k !== API_CACHE_NAME).map((k) => caches.delete(k)))
         )
     );
     self.clients.claim();
@@ -26,12 +30,9 @@ self.addEventListener('activate', (event) => {
 self.addEventListener('fetch', (event) => {
     if (event.request.method !== 'GET') return;
 
-    // API requests - network first
+    // API requests - revalidate against the network, cached copy offline
     if (event.request.url.includes('/api/')) {
-        event.respondWith(
-            fetch(event.request)
-                .catch(() => caches.match(event.request))
-        );
+        event.respondWith(revalidate(event.request));
         return;
     }
 
@@ -46,3 +47,31 @@ self.addEventListener('fetch', (event) => {
         })
     );
 });
+
+// Send If-None-Match for the cached copy; a 304 is answered from the cache.
+// If the page already sent its own If-None-Match, its 304 is passed through.
+async function revalidate(request) {
+    const cache = await caches.open(API_CACHE_NAME);
+    const cached = await cache.match(request);
+    const pageEtag = request.headers.get('If-None-Match');
+    const etag = !pageEtag && cached ? cached.headers.get('ETag') : null;
+
+    let networkRequest = request;
+    if (etag) {
+        const headers = new Headers(request.headers);
+        headers.set('If-None-Match', etag);
+        networkRequest = new Request(request, { headers });
+    }
+
+    try {
+        const response = await fetch(networkRequest);
+        if (response.status === 304 && etag) return cached;
+        if (response.ok && response.headers.get('ETag')) {
+            cache.put(request, response.clone());
+        }
+        return response;
+    } catch (err) {
+        if (cached) return cached;
+        throw err;
+    }
+}
@@ -1,6 +1,12 @@
 """
-Start the Solar Tracker application on localhost
+Start the Solar Tracker application
+
+    python run.py                      development: one process, auto-reload
+    python run.py --prod --port 8003   production: worker processes, no reload
 """
+import argparse
+import importlib.util
+import os
 import uvicorn
 import sys
 from pathlib import Path
@@ -8,12 +14,62 @@ from pathlib import Path
 # Add parent to path for imports
 sys.path.insert(0, str(Path(__file__).parent))
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Start the Solar Tracker server")
+    parser.add_argument("--prod", action="store_true",
+                        help="production mode: several workers, no reload, tuned server")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)),
+                        help="worker processes (production default: one per CPU, at most 4)")
+    parser.add_argument("--no-reload", action="store_true", help="don't restart on code changes")
+    parser.add_argument("--backlog", type=int, default=2048,
+                        help="pending connections the socket queues")
+    parser.add_argument("--keep-alive", type=int, default=30,
+                        help="seconds an idle keep-alive connection stays open (production)")
+    parser.add_argument("--graceful-timeout", type=int, default=20,
+                        help="seconds in-flight requests get to finish on shutdown")
+    return parser.parse_args()
+
+
+def available(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def server_options(args) -> dict:
+    if not args.prod:
+        return {"reload": not args.no_reload}
+
+    workers = args.workers or min(os.cpu_count() or 1, 4)
+    if workers > 1 and os.environ.get("SESSION_BACKEND") == "memory":
+        print("Warning: SESSION_BACKEND=memory does not share logins between workers")
+    return {
+        "reload": False,
+        "workers": workers,
+        # uvloop and httptools are faster, but optional (uvicorn[standard])
+        "loop": "uvloop" if available("uvloop") else "asyncio",
+        "http": "httptools" if available("httptools") else "h11",
+        # Lets nginx reuse upstream connections instead of reconnecting; needs
+        # an upstream with keepalive and proxy_http_version 1.1 (DEPLOYMENT.md)
+        "timeout_keep_alive": args.keep_alive,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+        "proxy_headers": True,
+        "access_log": False,
+    }
+
+
 if __name__ == "__main__":
-    print("Starting Solar Tracker on http://localhost:8000")
+    args = parse_args()
+    options = server_options(args)
+    print(f"Starting Solar Tracker on http://localhost:{args.port}")
+    if args.prod:
+        print(f"Production mode: {options['workers']} workers, {options['loop']} loop, {options['http']} parser")
     print("Press Ctrl+C to stop")
     uvicorn.run(
         "backend.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
+        host=args.host,
+        port=args.port,
+        backlog=args.backlog,
+        **options
     )